@@ -0,0 +1,8 @@
+from django.contrib import admin
+
+from analytics.models import DailyBookStats, DailyCohortStats, DailyTotals
+
+
+admin.site.register(DailyTotals)
+admin.site.register(DailyBookStats)
+admin.site.register(DailyCohortStats)
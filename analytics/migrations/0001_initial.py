@@ -0,0 +1,118 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("books", "0006_book_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyTotals",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                ("loans", models.PositiveIntegerField(default=0)),
+                ("returns", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "fines",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                ("new_users", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name_plural": "daily totals",
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyCohortStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("cohort", models.DateField()),
+                ("loans", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "fines",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "daily cohort stats",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date", "cohort"), name="daily_cohort_stats_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyBookStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("loans", models.PositiveIntegerField(default=0)),
+                ("returns", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "fines",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="books.book",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "daily book stats",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date", "book"), name="daily_book_stats_unique"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import models
+
+from books.models import Book
+
+
+class DailyTotals(models.Model):
+    date = models.DateField(unique=True)
+    loans = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(decimal_places=2, max_digits=12, default=0)
+    fines = models.DecimalField(decimal_places=2, max_digits=12, default=0)
+    new_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "daily totals"
+
+    def __str__(self):
+        return f"{self.date}: {self.loans} loans, {self.revenue} revenue"
+
+
+class DailyBookStats(models.Model):
+    date = models.DateField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False, related_name="daily_stats")
+    loans = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(decimal_places=2, max_digits=12, default=0)
+    fines = models.DecimalField(decimal_places=2, max_digits=12, default=0)
+
+    class Meta:
+        verbose_name_plural = "daily book stats"
+        constraints = [
+            models.UniqueConstraint(fields=["date", "book"], name="daily_book_stats_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: book {self.book_id}"
+
+
+class DailyCohortStats(models.Model):
+    """
+    Users are grouped into cohorts by the month they joined in.
+    """
+    date = models.DateField()
+    cohort = models.DateField()
+    loans = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(decimal_places=2, max_digits=12, default=0)
+    fines = models.DecimalField(decimal_places=2, max_digits=12, default=0)
+
+    class Meta:
+        verbose_name_plural = "daily cohort stats"
+        constraints = [
+            models.UniqueConstraint(fields=["date", "cohort"], name="daily_cohort_stats_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: cohort {self.cohort:%Y-%m}"
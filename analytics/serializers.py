@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+
+
+class AnalyticsParamsSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    top = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+    def validate(self, attrs):
+        attrs.setdefault("date_to", timezone.localdate() - timedelta(days=1))
+        attrs.setdefault("date_from", attrs["date_to"] - timedelta(days=settings.ANALYTICS_DEFAULT_RANGE_DAYS - 1))
+        if attrs["date_from"] > attrs["date_to"]:
+            raise serializers.ValidationError({"date_to": "date_to must not be earlier than date_from."})
+        if (attrs["date_to"] - attrs["date_from"]).days >= settings.ANALYTICS_MAX_RANGE_DAYS:
+            raise serializers.ValidationError(
+                {"date_from": f"The range can span at most {settings.ANALYTICS_MAX_RANGE_DAYS} days."}
+            )
+        return attrs
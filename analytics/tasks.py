@@ -0,0 +1,16 @@
+from datetime import date
+
+from celery import shared_task
+
+from analytics.rollups import build_rollups
+
+
+@shared_task
+def build_daily_rollups(date_from: str = None, date_to: str = None) -> list:
+    # Read from the primary: a day rolled up from a lagging replica would
+    # miss its last rows, and finished days are not rebuilt.
+    days = build_rollups(
+        date.fromisoformat(date_from) if date_from else None,
+        date.fromisoformat(date_to) if date_to else None
+    )
+    return [day.isoformat() for day in days]
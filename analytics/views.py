@@ -0,0 +1,115 @@
+from django.db.models import Sum
+from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter, OpenApiResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from analytics.models import DailyBookStats, DailyCohortStats, DailyTotals
+from analytics.serializers import AnalyticsParamsSerializer
+from library_service.db_router import ReplicaReadMixin
+
+
+class AnalyticsView(ReplicaReadMixin, APIView):
+    permission_classes = [IsAdminUser, ]
+
+    @extend_schema(
+        summary="Library analytics for a date range",
+        description="Loans, returns, revenue and fines per day, the top titles and the activity of "
+                    "user cohorts (by month joined) between date_from and date_to (only for admins). "
+                    "Answered from the nightly rollups, so today is not included yet",
+        tags=["analytics"],
+        parameters=[
+            OpenApiParameter("date_from", type=str, description="YYYY-MM-DD, defaults to 30 days ago", required=False),
+            OpenApiParameter("date_to", type=str, description="YYYY-MM-DD, defaults to yesterday", required=False),
+            OpenApiParameter("top", type=int, description="Number of top titles (1-100, default 10)", required=False),
+        ],
+        responses={
+            200: OpenApiResponse(
+                description="OK",
+                examples=[
+                    OpenApiExample(
+                        "Analytics",
+                        value={
+                            "date_from": "2025-06-01",
+                            "date_to": "2025-06-02",
+                            "totals": {
+                                "loans": 12, "returns": 9, "revenue": "84.50", "fines": "12.00", "new_users": 3
+                            },
+                            "daily": [
+                                {
+                                    "date": "2025-06-01", "loans": 7, "returns": 4,
+                                    "revenue": "50.50", "fines": "0.00", "new_users": 2
+                                },
+                                {
+                                    "date": "2025-06-02", "loans": 5, "returns": 5,
+                                    "revenue": "34.00", "fines": "12.00", "new_users": 1
+                                }
+                            ],
+                            "top_titles": [
+                                {"book_id": 1, "title": "Kobzar", "loans": 4, "revenue": "22.00"}
+                            ],
+                            "cohorts": [
+                                {"cohort": "2025-05-01", "loans": 8, "revenue": "60.50", "fines": "12.00"}
+                            ]
+                        }
+                    )
+                ]
+            ),
+            400: OpenApiResponse(description="Bad Request"),
+        }
+    )
+    def get(self, request):
+        params = AnalyticsParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        date_from, date_to = params.validated_data["date_from"], params.validated_data["date_to"]
+        in_range = {"date__gte": date_from, "date__lte": date_to}
+
+        daily = list(
+            DailyTotals.objects
+            .filter(**in_range)
+            .order_by("date")
+            .values("date", "loans", "returns", "revenue", "fines", "new_users")
+        )
+        totals = {
+            key: sum(day[key] for day in daily)
+            for key in ("loans", "returns", "revenue", "fines", "new_users")
+        }
+        top_titles = list(
+            DailyBookStats.objects
+            .filter(**in_range)
+            .values("book_id", "book__title")
+            .annotate(total_loans=Sum("loans"), total_revenue=Sum("revenue"))
+            .order_by("-total_loans", "-total_revenue", "book_id")[:params.validated_data["top"]]
+        )
+        cohorts = (
+            DailyCohortStats.objects
+            .filter(**in_range)
+            .values("cohort")
+            .annotate(total_loans=Sum("loans"), total_revenue=Sum("revenue"), total_fines=Sum("fines"))
+            .order_by("cohort")
+        )
+
+        return Response({
+            "date_from": date_from,
+            "date_to": date_to,
+            "totals": totals,
+            "daily": daily,
+            "top_titles": [
+                {
+                    "book_id": row["book_id"],
+                    "title": row["book__title"],
+                    "loans": row["total_loans"],
+                    "revenue": row["total_revenue"],
+                }
+                for row in top_titles
+            ],
+            "cohorts": [
+                {
+                    "cohort": row["cohort"],
+                    "loans": row["total_loans"],
+                    "revenue": row["total_revenue"],
+                    "fines": row["total_fines"],
+                }
+                for row in cohorts
+            ],
+        })
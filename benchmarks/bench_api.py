@@ -0,0 +1,200 @@
+"""
+pyperf benchmarks for the API hot paths, run in-process through the full
+middleware stack against a seeded SQLite database, with Stripe and
+Telegram replaced by local stubs.
+
+    python benchmarks/bench_api.py -o before.json
+    python benchmarks/bench_api.py -o after.json
+    python -m pyperf compare_to before.json after.json
+
+The dataset scale is set with --books, --users, --borrowings and
+--payments; the database is reseeded only when the scale changes.
+--database (default BENCH_DATABASE) picks another SQLite file.
+"""
+import os
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import pyperf
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+SCALE_OPTIONS = ("books", "users", "borrowings", "payments")
+DEFAULT_SCALE = {"books": 2000, "users": 500, "borrowings": 20000, "payments": 20000}
+DEFAULT_DATABASE = str(Path(__file__).resolve().parent / "bench.sqlite3")
+
+
+def add_cmdline_args(cmd, args):
+    # pyperf starts its workers with a clean environment, so everything
+    # they need is passed on the command line.
+    for option in SCALE_OPTIONS:
+        cmd.extend((f"--{option}", str(getattr(args, option))))
+    cmd.extend(("--database", args.database))
+
+
+def client_for(user):
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+    return client
+
+
+def time_requests(loops, client, method, url, expected_status, data=None):
+    request = getattr(client, method)
+    started = time.perf_counter()
+    for _ in range(loops):
+        response = request(url, data=data, format="json") if data is not None else request(url)
+        if response.status_code != expected_status:
+            raise RuntimeError(f"{method.upper()} {url} answered {response.status_code}: {response.content[:200]}")
+    return time.perf_counter() - started
+
+
+def time_uncached_requests(loops, client, url):
+    """
+    Like time_requests, but every request finds the catalog cache empty
+    and builds its page from the database.
+    """
+    from books.cache import invalidate_catalog
+
+    elapsed = 0.0
+    for _ in range(loops):
+        invalidate_catalog()
+        elapsed += time_requests(1, client, "get", url, 200)
+    return elapsed
+
+
+def time_borrowing_create(loops, client, book_ids):
+    from django.urls import reverse
+    from django.utils import timezone
+
+    from books.models import Book
+    from borrowings.models import Borrowing
+    from payments.models import Payment
+    from telegram_bot.models import Notification
+
+    url = reverse("borrowings:borrowing-list")
+    expected_return_date = (timezone.now() + timedelta(days=14)).isoformat()
+    last_ids = [model.objects.order_by("-id").values_list("id", flat=True).first() or 0
+                for model in (Borrowing, Payment, Notification)]
+
+    started = time.perf_counter()
+    for i in range(loops):
+        response = client.post(
+            url,
+            data={"book": book_ids[i % len(book_ids)], "expected_return_date": expected_return_date},
+            format="json"
+        )
+        if response.status_code != 201:
+            raise RuntimeError(f"POST {url} answered {response.status_code}: {response.content[:200]}")
+    elapsed = time.perf_counter() - started
+
+    # Undo the loans like a cancelled payment would, so every run sees
+    # the same dataset.
+    created = Borrowing.objects.filter(id__gt=last_ids[0])
+    Book.objects.release_many(list(created.values_list("book_id", flat=True)), cancelled=True)
+    for model, last_id in zip((Payment, Borrowing, Notification), last_ids):
+        model.objects.filter(id__gt=last_id).delete()
+    return elapsed
+
+
+def time_borrowing_return(loops, client, reader, book_ids):
+    from django.urls import reverse
+    from django.utils import timezone
+
+    from books.models import Book
+    from borrowings.models import Borrowing
+    from payments.models import Payment
+
+    last_payment = Payment.objects.order_by("-id").values_list("id", flat=True).first() or 0
+    now = timezone.now()
+    borrowings = []
+    for i in range(loops):
+        book_id = book_ids[i % len(book_ids)]
+        Book.objects.reserve(book_id)
+        borrowings.append(Borrowing.objects.create(
+            book_id=book_id,
+            user=reader,
+            borrow_date=now - timedelta(days=3),
+            # Half of them come back late and open a fine checkout session.
+            expected_return_date=now + timedelta(days=7) if i % 2 else now - timedelta(days=1),
+        ))
+
+    started = time.perf_counter()
+    for borrowing in borrowings:
+        url = reverse("borrowings:return-book", kwargs={"pk": borrowing.pk})
+        response = client.post(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"POST {url} answered {response.status_code}: {response.content[:200]}")
+    elapsed = time.perf_counter() - started
+
+    Payment.objects.filter(id__gt=last_payment).delete()
+    Borrowing.objects.filter(pk__in=[borrowing.pk for borrowing in borrowings]).delete()
+    return elapsed
+
+
+def time_every_day_notification(loops):
+    from telegram_bot.tasks import every_day_notification
+
+    started = time.perf_counter()
+    for _ in range(loops):
+        every_day_notification()
+    return time.perf_counter() - started
+
+
+def main():
+    runner = pyperf.Runner(add_cmdline_args=add_cmdline_args)
+    for option in SCALE_OPTIONS:
+        runner.argparser.add_argument(f"--{option}", type=int, default=DEFAULT_SCALE[option])
+    runner.argparser.add_argument("--database", default=os.environ.get("BENCH_DATABASE", DEFAULT_DATABASE))
+    args = runner.parse_args()
+    os.environ["BENCH_DATABASE"] = args.database
+    runner.metadata["dataset"] = ", ".join(f"{option}={getattr(args, option)}" for option in SCALE_OPTIONS)
+
+    import django
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+
+    from benchmarks import stubs
+    from benchmarks.seed import ensure_dataset
+    from books.models import Book
+    from borrowings.models import Borrowing
+
+    if not args.worker:
+        ensure_dataset(**{option: getattr(args, option) for option in SCALE_OPTIONS})
+    stubs.install()
+
+    User = get_user_model()
+    staff = User.objects.get(is_staff=True)
+    reader = User.objects.get(pk=Borrowing.objects.order_by("user_id").values_list("user_id", flat=True).first())
+    staff_client, reader_client = client_for(staff), client_for(reader)
+    book_ids = list(Book.objects.filter(inventory__gt=0).order_by("id").values_list("id", flat=True)[:100])
+
+    book_list_url = reverse("books:book-list")
+    book_detail_url = reverse("books:book-detail", kwargs={"pk": book_ids[0]})
+    runner.bench_time_func("book_list_cache_hit", time_requests, reader_client, "get", book_list_url, 200)
+    runner.bench_time_func("book_list_cache_miss", time_uncached_requests, reader_client, book_list_url)
+    runner.bench_time_func("book_detail_cache_hit", time_requests, reader_client, "get", book_detail_url, 200)
+    runner.bench_time_func("book_detail_cache_miss", time_uncached_requests, reader_client, book_detail_url)
+    runner.bench_time_func(
+        "borrowing_list_staff", time_requests, staff_client, "get", reverse("borrowings:borrowing-list"), 200
+    )
+    runner.bench_time_func(
+        "borrowing_list_reader", time_requests, reader_client, "get", reverse("borrowings:borrowing-list"), 200
+    )
+    runner.bench_time_func("borrowing_create", time_borrowing_create, reader_client, book_ids)
+    runner.bench_time_func("borrowing_return", time_borrowing_return, staff_client, reader, book_ids)
+    runner.bench_time_func(
+        "payment_list", time_requests, reader_client, "get", reverse("payments:payment_list"), 200
+    )
+    runner.bench_time_func("every_day_notification", time_every_day_notification)
+
+
+if __name__ == "__main__":
+    main()
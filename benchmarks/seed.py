@@ -0,0 +1,113 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from books.cache import invalidate_catalog
+from books.counters import reconcile_counters
+from books.models import Book
+from borrowings.models import Borrowing
+from payments.models import Payment
+from telegram_bot.models import Notification, UserProfile
+
+
+PASSWORD = "bench-password"
+BATCH_SIZE = 1000
+
+
+def dataset_scale() -> dict:
+    return {
+        "books": Book.objects.count(),
+        "users": get_user_model().objects.filter(is_staff=False).count(),
+        "borrowings": Borrowing.objects.count(),
+        "payments": Payment.objects.count(),
+    }
+
+
+def ensure_dataset(books: int, users: int, borrowings: int, payments: int, seed: int = 0) -> bool:
+    """
+    Migrate the benchmark database and seed it, unless it already holds a
+    dataset of exactly this scale. Returns whether it was (re)seeded.
+    """
+    call_command("migrate", interactive=False, verbosity=0)
+    scale = {"books": books, "users": users, "borrowings": borrowings, "payments": payments}
+    if dataset_scale() == scale:
+        return False
+    seed_dataset(random.Random(seed), **scale)
+    return True
+
+
+@transaction.atomic
+def seed_dataset(rng: random.Random, books: int, users: int, borrowings: int, payments: int) -> None:
+    User = get_user_model()
+    for model in (Payment, Borrowing, Notification, UserProfile, Book):
+        model.objects.all().delete()
+    User.objects.all().delete()
+
+    now = timezone.now()
+    password = make_password(PASSWORD)
+    User.objects.create_superuser(email="staff@bench.local", password=PASSWORD)
+    User.objects.bulk_create(
+        (
+            User(email=f"reader{i}@bench.local", password=password, date_joined=now - timedelta(days=rng.randint(0, 730)))
+            for i in range(users)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    readers = list(User.objects.filter(is_staff=False).order_by("id").values_list("id", "email"))
+    # Every other reader has the bot connected, like a real user base.
+    UserProfile.objects.bulk_create(
+        (UserProfile(email=email, telegram_chat_id=str(user_id)) for user_id, email in readers[::2]),
+        batch_size=BATCH_SIZE
+    )
+
+    Book.objects.bulk_create(
+        (
+            Book(
+                title=f"Benchmark title {i}",
+                author=f"Author {i % max(books // 5, 1)}",
+                cover=rng.choice(["Hard", "Soft"]),
+                inventory=rng.randint(5, 50),
+                daily_fee=Decimal(rng.randint(50, 500)) / 100,
+            )
+            for i in range(books)
+        ),
+        batch_size=BATCH_SIZE
+    )
+    book_ids = list(Book.objects.values_list("id", flat=True))
+
+    def borrowing(i):
+        borrow_date = now - timedelta(days=rng.randint(0, 365), minutes=rng.randint(0, 1440))
+        expected = borrow_date + timedelta(days=rng.randint(1, 30))
+        returned = rng.random() < 0.8
+        return Borrowing(
+            borrow_date=borrow_date,
+            expected_return_date=expected,
+            actual_return_date=borrow_date + timedelta(days=rng.randint(1, 40)) if returned else None,
+            pay_status="PAID" if returned else "PENDING",
+            book_id=rng.choice(book_ids),
+            user_id=rng.choice(readers)[0],
+        )
+    Borrowing.objects.bulk_create((borrowing(i) for i in range(borrowings)), batch_size=BATCH_SIZE)
+    borrowing_ids = list(Borrowing.objects.values_list("id", flat=True))
+
+    def payment(i):
+        paid = rng.random() < 0.9
+        return Payment(
+            status="PAID" if paid else "PENDING",
+            type="FINE" if rng.random() < 0.1 else "PAYMENT",
+            borrowing_id=borrowing_ids[i % len(borrowing_ids)] if borrowing_ids else None,
+            session_id=f"cs_seed_{i}",
+            session_url=f"https://checkout.stripe.test/cs_seed_{i}",
+            money_to_pay=Decimal(rng.randint(100, 5000)) / 100,
+            paid_at=now - timedelta(days=rng.randint(0, 365)) if paid else None,
+        )
+    Payment.objects.bulk_create((payment(i) for i in range(payments)), batch_size=BATCH_SIZE)
+
+    reconcile_counters(fix=True)
+    invalidate_catalog()
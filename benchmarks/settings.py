@@ -0,0 +1,34 @@
+import os
+
+os.environ.setdefault("SECRET_KEY", "benchmarks")
+os.environ.setdefault("STRIPE_PUBLIC_KEY", "pk_bench")
+os.environ.setdefault("STRIPE_PRIVATE_KEY", "sk_bench")
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ.setdefault("WEBHOOK_WITHOUT_PROTOCOL_AND_PATH", "bench.local")
+
+from library_service.settings import *  # noqa: E402,F401,F403
+
+
+# Query logging under DEBUG would grow without bound over thousands of
+# loops and add its own cost to every query.
+DEBUG = False
+
+ALLOWED_HOSTS = ["testserver"]
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        # bench_api.py sets this from --database in every pyperf process.
+        "NAME": env("BENCH_DATABASE", default=str(BASE_DIR / "benchmarks" / "bench.sqlite3")),
+    }
+}
+
+# Tasks queued by the measured requests run inline against the stubs
+# instead of waiting for a broker.
+CELERY_TASK_ALWAYS_EAGER = True
+
+CELERY_TASK_EAGER_PROPAGATES = True
+
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+SLOW_REQUEST_MS = 0
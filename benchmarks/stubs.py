@@ -0,0 +1,50 @@
+import itertools
+from types import SimpleNamespace
+from unittest import mock
+
+
+class StubSender:
+    """
+    Stands in for TelegramSender: accepts every message without a network
+    round trip, so the benchmarks measure our code and not Telegram.
+    """
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, chat_id, text: str) -> dict:
+        self.sent += 1
+        return {"ok": True}
+
+    def send_each(self, messages) -> list:
+        return [bool(self.send(*message)) for message in messages]
+
+    def send_many(self, messages) -> dict:
+        results = self.send_each(messages)
+        return {"sent": results.count(True), "failed": results.count(False)}
+
+
+_session_ids = itertools.count(1)
+
+
+def create_session(**kwargs):
+    session_id = f"cs_bench_{next(_session_ids)}"
+    return SimpleNamespace(id=session_id, url=f"https://checkout.stripe.test/{session_id}")
+
+
+def retrieve_session(session_id, **kwargs):
+    return SimpleNamespace(id=session_id, payment_status="paid", amount_total=100, currency="usd")
+
+
+def install() -> StubSender:
+    """
+    Replace the Stripe checkout calls and the Telegram sender with local
+    stubs for the rest of the process.
+    """
+    sender = StubSender()
+    for patcher in (
+        mock.patch("stripe.checkout.Session.create", side_effect=create_session),
+        mock.patch("stripe.checkout.Session.retrieve", side_effect=retrieve_session),
+        mock.patch("telegram_bot.sender._sender", sender),
+    ):
+        patcher.start()
+    return sender
@@ -3,4 +3,8 @@ from django.contrib import admin
 from books.models import Book
 
 
-admin.site.register(Book)
+@admin.register(Book)
+class BookAdmin(admin.ModelAdmin):
+    list_display = ("title", "author", "cover", "inventory", "on_loan", "overdue", "lifetime_loans", "revenue")
+    readonly_fields = ("on_loan", "overdue", "lifetime_loans", "revenue")
+    search_fields = ("title", "author")
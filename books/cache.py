@@ -0,0 +1,108 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from library_service.metrics import CATALOG_CACHE_LOOKUPS, CATALOG_CACHE_SECONDS, sample_value
+
+
+VERSION_KEY = "catalog:version"
+
+
+def _stock_key(pk) -> str:
+    return f"catalog:stock:{pk}"
+
+
+def catalog_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def stock_version(pk) -> int:
+    """
+    Version of one book's shelf counters. Loans and returns move it, and
+    only that book's cached detail is rebuilt.
+    """
+    version = cache.get(_stock_key(pk))
+    if version is None:
+        cache.add(_stock_key(pk), time.time_ns(), timeout=None)
+        version = cache.get(_stock_key(pk))
+    return version
+
+
+def _bump_version() -> None:
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_catalog() -> None:
+    """
+    Drop every cached catalog page at once by moving to a new version.
+    Inside a transaction the version moves again on commit, so a page
+    rebuilt from not-yet-committed data in between is not served either.
+    """
+    _bump_version()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(_bump_version)
+
+
+def _bump_stock(pks: list) -> None:
+    stamp = time.time_ns()
+    cache.set_many({_stock_key(pk): stamp for pk in pks}, timeout=None)
+
+
+def invalidate_stock(pks: list) -> None:
+    """
+    Drop the cached details of the given books after a loan or return.
+    List pages keep their counters until the next catalog change; they
+    are rebuilt when a book runs out or comes back, see BookQuerySet.
+    """
+    _bump_stock(pks)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump_stock(pks))
+
+
+def get_or_build(key: str, build):
+    """
+    Return the cached data for `key` in the current catalog version, or
+    call `build()` and cache its result. `build` returns (data, cacheable).
+    """
+    started = time.perf_counter()
+    versioned_key = f"catalog:{catalog_version()}:{key}"
+    data = cache.get(versioned_key)
+    if data is not None:
+        CATALOG_CACHE_LOOKUPS.labels("hit").inc()
+        CATALOG_CACHE_SECONDS.labels("hit").inc(time.perf_counter() - started)
+        return data
+
+    data, cacheable = build()
+    if cacheable:
+        cache.set(versioned_key, data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    CATALOG_CACHE_LOOKUPS.labels("miss").inc()
+    CATALOG_CACHE_SECONDS.labels("miss").inc(time.perf_counter() - started)
+    return data
+
+
+def catalog_cache_stats() -> dict:
+    """
+    Lookups are counted in process memory, next to the other metrics, so a
+    hit costs no extra cache round trips.
+    """
+    hits = sample_value("library_catalog_cache_lookups_total", {"result": "hit"})
+    misses = sample_value("library_catalog_cache_lookups_total", {"result": "miss"})
+    hit_time = sample_value("library_catalog_cache_lookup_seconds_total", {"result": "hit"})
+    miss_time = sample_value("library_catalog_cache_lookup_seconds_total", {"result": "miss"})
+    lookups = hits + misses
+    return {
+        "hits": int(hits),
+        "misses": int(misses),
+        "hit_ratio": hits / lookups if lookups else 0.0,
+        "avg_hit_ms": hit_time / hits * 1000 if hits else 0.0,
+        "avg_miss_ms": miss_time / misses * 1000 if misses else 0.0,
+    }
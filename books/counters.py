@@ -0,0 +1,125 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from books.cache import invalidate_catalog
+from payments.models import PAID_STATUSES
+
+
+COUNTER_FIELDS = ["on_loan", "overdue", "lifetime_loans", "revenue"]
+
+
+def counter_expressions(borrowing_model, payment_model, now) -> dict:
+    """
+    Expressions that count every counter of a book from scratch.
+    """
+    borrowings = borrowing_model.objects.filter(book=OuterRef("pk")).order_by().values("book")
+    open_borrowings = borrowings.filter(actual_return_date__isnull=True)
+    paid = (
+        payment_model.objects
+        .filter(borrowing__book=OuterRef("pk"), status__in=PAID_STATUSES)
+        .order_by()
+        .values("borrowing__book")
+    )
+
+    def count(queryset):
+        return Coalesce(
+            Subquery(queryset.annotate(total=Count("id")).values("total")),
+            Value(0),
+            output_field=models.PositiveIntegerField()
+        )
+
+    return {
+        "on_loan": count(open_borrowings),
+        "overdue": count(open_borrowings.filter(expected_return_date__lte=now)),
+        "lifetime_loans": count(borrowings),
+        "revenue": Coalesce(
+            Subquery(paid.annotate(total=Sum("money_to_pay")).values("total")),
+            Value(Decimal("0.00")),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        ),
+    }
+
+
+def refresh_overdue_counters() -> int:
+    """
+    Loans turn overdue by the clock alone, with no write to hook into, so
+    the overdue counters are recounted from the open-loans partial index
+    on a schedule. Returns the number of books whose counter changed.
+    """
+    from books.models import Book
+    from borrowings.models import Borrowing
+    from payments.models import Payment
+
+    now = timezone.now()
+    overdue_books = (
+        Borrowing.objects
+        .filter(actual_return_date__isnull=True, expected_return_date__lte=now)
+        .values("book")
+    )
+    expected_overdue = counter_expressions(Borrowing, Payment, now)["overdue"]
+
+    with transaction.atomic():
+        changed = Book.objects.filter(overdue__gt=0).exclude(pk__in=overdue_books).update(overdue=0)
+        changed += (
+            Book.objects
+            .filter(pk__in=overdue_books)
+            .alias(expected_overdue=expected_overdue)
+            .exclude(overdue=F("expected_overdue"))
+            .update(overdue=expected_overdue)
+        )
+    if changed:
+        invalidate_catalog()
+    return changed
+
+
+def reconcile_counters(fix: bool = True) -> dict:
+    """
+    Recount every counter in bulk, a chunk of books at a time, and report
+    how many books and values had drifted. With `fix` they are corrected.
+    """
+    from books.models import Book
+    from borrowings.models import Borrowing
+    from payments.models import Payment
+
+    chunk_size = settings.BOOK_COUNTERS_RECONCILE_CHUNK_SIZE
+    expressions = counter_expressions(Borrowing, Payment, timezone.now())
+    report = {"books": 0, "drifted": 0, **{field: 0 for field in COUNTER_FIELDS}}
+    last_id = 0
+
+    while True:
+        with transaction.atomic():
+            books = list(
+                Book.objects
+                .select_for_update(of=("self",))
+                .filter(id__gt=last_id)
+                .order_by("id")
+                .only("id", *COUNTER_FIELDS)
+                .annotate(**{f"expected_{field}": expression for field, expression in expressions.items()})
+                [:chunk_size]
+            )
+            if not books:
+                break
+            last_id = books[-1].id
+            report["books"] += len(books)
+
+            drifted = []
+            for book in books:
+                fields = [field for field in COUNTER_FIELDS if getattr(book, field) != getattr(book, f"expected_{field}")]
+                for field in fields:
+                    report[field] += 1
+                    setattr(book, field, getattr(book, f"expected_{field}"))
+                if fields:
+                    drifted.append(book)
+            report["drifted"] += len(drifted)
+
+            if fix and drifted:
+                Book.objects.bulk_update(drifted, COUNTER_FIELDS)
+
+    if fix and report["drifted"]:
+        invalidate_catalog()
+    return report
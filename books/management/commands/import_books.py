@@ -0,0 +1,112 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from books.cache import invalidate_catalog
+from books.models import Book
+from books.serializers import BookImportSerializer
+
+
+UNIQUE_FIELDS = ["title", "author", "cover"]
+UPDATE_FIELDS = ["inventory", "daily_fee", "updated_at"]
+
+
+def read_csv(path: Path):
+    with path.open(newline="", encoding="utf-8-sig") as feed:
+        reader = csv.DictReader(feed)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def read_jsonl(path: Path):
+    """
+    Lines that are not valid JSON are passed on as raw strings, which the
+    serializer then rejects like any other malformed row.
+    """
+    with path.open(encoding="utf-8") as feed:
+        for line_number, line in enumerate(feed, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError:
+                yield line_number, line.rstrip("\n")
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream books from a CSV or JSONL feed and upsert them by (title, author, cover) "
+        "in chunks, each in its own transaction. Rejected rows go to a side file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument("--format", choices=READERS, help="Defaults to the file extension")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--rejects", type=Path, help="Defaults to <path>.rejects.jsonl")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.is_file():
+            raise CommandError(f"{path} does not exist")
+        feed_format = options["format"] or path.suffix.lstrip(".").lower()
+        if feed_format not in READERS:
+            raise CommandError(f"Unknown feed format '{feed_format}', use --format csv or jsonl")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+        rejects_path = options["rejects"] or path.with_name(f"{path.name}.rejects.jsonl")
+
+        rows = READERS[feed_format](path)
+        validator = BookImportSerializer()
+        imported = rejected = 0
+        rejects_file = None
+        started = time.perf_counter()
+
+        try:
+            while chunk := list(islice(rows, options["chunk_size"])):
+                books = {}
+                for line_number, row in chunk:
+                    try:
+                        data = validator.run_validation(row)
+                    except ValidationError as error:
+                        if rejects_file is None:
+                            rejects_file = rejects_path.open("w", encoding="utf-8")
+                        rejects_file.write(
+                            json.dumps({"line": line_number, "row": row, "errors": error.detail}, default=str) + "\n"
+                        )
+                        rejected += 1
+                        continue
+                    # Postgres refuses to upsert the same key twice in one statement.
+                    books[tuple(data[field] for field in UNIQUE_FIELDS)] = Book(**data)
+
+                with transaction.atomic():
+                    Book.objects.bulk_create(
+                        books.values(),
+                        update_conflicts=True,
+                        unique_fields=UNIQUE_FIELDS,
+                        update_fields=UPDATE_FIELDS,
+                    )
+                imported += len(books)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"{imported} rows imported, {rejected} rejected ({imported / elapsed:.0f} rows/s)")
+        finally:
+            if rejects_file is not None:
+                rejects_file.close()
+            if imported:
+                invalidate_catalog()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} books in {elapsed:.1f}s ({imported / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
+        if rejected:
+            self.stdout.write(self.style.WARNING(f"{rejected} rows rejected, see {rejects_path}"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from books.counters import COUNTER_FIELDS, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Recount the per-book loan and revenue counters from borrowings and payments and report drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report drift, do not correct it")
+
+    def handle(self, *args, **options):
+        report = reconcile_counters(fix=not options["dry_run"])
+
+        self.stdout.write(f"Checked {report['books']} books, {report['drifted']} drifted")
+        for field in COUNTER_FIELDS:
+            if report[field]:
+                self.stdout.write(f"  {field}: {report[field]} books off")
+        if report["drifted"] and not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS("Drifted counters were corrected"))
@@ -0,0 +1,72 @@
+from django.db import migrations
+
+
+# Other migrations that rebuild books_book on SQLite, which drops these
+# triggers, import restore_search_triggers from here to put them back.
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER books_book_fts_insert AFTER INSERT ON books_book BEGIN "
+    "INSERT INTO books_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); "
+    "END",
+    "CREATE TRIGGER books_book_fts_delete AFTER DELETE ON books_book BEGIN "
+    "INSERT INTO books_book_fts(books_book_fts, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); "
+    "END",
+    "CREATE TRIGGER books_book_fts_update AFTER UPDATE OF title, author ON books_book BEGIN "
+    "INSERT INTO books_book_fts(books_book_fts, rowid, title, author) "
+    "VALUES ('delete', old.id, old.title, old.author); "
+    "INSERT INTO books_book_fts(rowid, title, author) VALUES (new.id, new.title, new.author); "
+    "END",
+]
+SQLITE_REBUILD = "INSERT INTO books_book_fts(books_book_fts) VALUES ('rebuild')"
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE books_book_fts USING fts5("
+    "title, author, content='books_book', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+    *SQLITE_TRIGGERS,
+    SQLITE_REBUILD,
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS books_book_fts_update",
+    "DROP TRIGGER IF EXISTS books_book_fts_delete",
+    "DROP TRIGGER IF EXISTS books_book_fts_insert",
+    "DROP TABLE IF EXISTS books_book_fts",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX book_search_idx ON books_book USING GIN (("
+    "setweight(to_tsvector('simple', books_book.title), 'A') || "
+    "setweight(to_tsvector('simple', books_book.author), 'B')))",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS book_search_idx",
+]
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for name in ("insert", "delete", "update"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS books_book_fts_{name}")
+        for statement in [*SQLITE_TRIGGERS, SQLITE_REBUILD]:
+            schema_editor.execute(statement)
+
+
+def run(statements_by_vendor):
+    def apply(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0002_book_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            run({"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+# SQLite applies AddConstraint by rebuilding books_book, which drops the
+# full-text triggers from 0003_book_search_index; put them back.
+restore_search_triggers = import_module("books.migrations.0003_book_search_index").restore_search_triggers
+
+
+def merge_duplicate_editions(apps, schema_editor):
+    """
+    The API used to accept the same edition more than once. Keep the
+    oldest row of each edition, add the other rows' inventory to it, move
+    their borrowings over and delete them.
+    """
+    Book = apps.get_model("books", "Book")
+    Borrowing = apps.get_model("borrowings", "Borrowing")
+
+    editions = (
+        Book.objects
+        .values("title", "author", "cover")
+        .annotate(copies=Count("id"), keep=Min("id"))
+        .filter(copies__gt=1)
+        .order_by()
+    )
+    for edition in editions:
+        duplicates = dict(
+            Book.objects
+            .filter(title=edition["title"], author=edition["author"], cover=edition["cover"])
+            .exclude(pk=edition["keep"])
+            .values_list("id", "inventory")
+        )
+        Borrowing.objects.filter(book_id__in=duplicates).update(book_id=edition["keep"])
+        Book.objects.filter(pk=edition["keep"]).update(inventory=F("inventory") + sum(duplicates.values()))
+        Book.objects.filter(pk__in=duplicates).delete()
+    # Fire PostgreSQL's deferred foreign-key checks now: ALTER TABLE
+    # refuses to run while they are pending.
+    schema_editor.connection.check_constraints()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0003_book_search_index"),
+        ("borrowings", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_editions, migrations.RunPython.noop),
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddConstraint(
+            model_name="book",
+            constraint=models.UniqueConstraint(fields=["title", "author", "cover"], name="book_edition_unique"),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+# SQLite applies this by rebuilding books_book, which drops the full-text
+# triggers from 0003_book_search_index; put them back.
+restore_search_triggers = import_module("books.migrations.0003_book_search_index").restore_search_triggers
+
+
+def clamp_negative_inventory(apps, schema_editor):
+    # The old read-modify-write borrow path could oversell a book.
+    Book = apps.get_model("books", "Book")
+    Book.objects.filter(inventory__lt=0).update(inventory=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_book_edition_unique"),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_negative_inventory, migrations.RunPython.noop),
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddConstraint(
+            model_name="book",
+            constraint=models.CheckConstraint(
+                condition=models.Q(inventory__gte=0),
+                name="book_inventory_non_negative",
+            ),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
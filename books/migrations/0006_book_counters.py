@@ -0,0 +1,80 @@
+from decimal import Decimal
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+# SQLite applies this by rebuilding books_book, which drops the full-text
+# triggers from 0003_book_search_index; put them back.
+restore_search_triggers = import_module("books.migrations.0003_book_search_index").restore_search_triggers
+
+
+def backfill_counters(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    Borrowing = apps.get_model("borrowings", "Borrowing")
+    Payment = apps.get_model("payments", "Payment")
+
+    borrowings = Borrowing.objects.filter(book=OuterRef("pk")).order_by().values("book")
+    open_borrowings = borrowings.filter(actual_return_date__isnull=True)
+    paid = (
+        Payment.objects
+        .filter(borrowing__book=OuterRef("pk"), status__in=("Paid", "PAID"))
+        .order_by()
+        .values("borrowing__book")
+    )
+
+    def count(queryset):
+        return Coalesce(
+            Subquery(queryset.annotate(total=Count("id")).values("total")),
+            Value(0),
+            output_field=models.PositiveIntegerField()
+        )
+
+    Book.objects.update(
+        on_loan=count(open_borrowings),
+        overdue=count(open_borrowings.filter(expected_return_date__lte=timezone.now())),
+        lifetime_loans=count(borrowings),
+        revenue=Coalesce(
+            Subquery(paid.annotate(total=Sum("money_to_pay")).values("total")),
+            Value(Decimal("0.00")),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0005_book_inventory_non_negative"),
+        ("borrowings", "0003_borrowing_updated_at"),
+        ("payments", "0004_payment_borrowing_foreign_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name="book",
+            name="lifetime_loans",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="on_loan",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="overdue",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="revenue",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
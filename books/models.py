@@ -1,5 +1,147 @@
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from books.cache import invalidate_catalog, invalidate_stock
+
+
+class BookQuerySet(models.QuerySet):
+    def reserve(self, pk) -> bool:
+        """
+        Take one copy off the shelf with a single conditional UPDATE,
+        so concurrent borrowings can never oversell the last copy.
+        The loan counters move in the same statement.
+        """
+        reserved = self.filter(pk=pk, inventory__gt=0).update(**self._reserve_changes()) == 1
+        if reserved:
+            self._invalidate_stock([pk], emptied=True)
+        return reserved
+
+    def reserve_many(self, pks: list) -> bool:
+        """
+        Take one copy of each of the distinct books in a single UPDATE.
+        Returns False when any of them is out of stock; the caller must
+        then roll back its transaction to undo the partial reservation.
+        """
+        reserved = self.filter(pk__in=pks, inventory__gt=0).update(**self._reserve_changes()) == len(pks)
+        self._invalidate_stock(pks, emptied=True)
+        return reserved
+
+    def release(self, pk, overdue: bool = False) -> None:
+        self.filter(pk=pk).update(**self._release_changes(overdue=overdue))
+        self._invalidate_stock([pk], emptied=False)
+
+    def release_many(self, pks: list, cancelled: bool = False, overdue: bool = False) -> None:
+        """
+        Put one copy of each book back. Cancelled loans never happened,
+        so they are also taken off the lifetime count.
+        """
+        if not pks:
+            return
+        changes = self._release_changes(overdue=overdue)
+        if cancelled:
+            changes["lifetime_loans"] = Greatest(F("lifetime_loans") - 1, 0)
+        self.filter(pk__in=pks).update(**changes)
+        self._invalidate_stock(pks, emptied=False)
+
+    def forget_returned_loans(self, pks: list) -> None:
+        """
+        Take cancelled loans whose copy is already back on the shelf off
+        the lifetime count.
+        """
+        if not pks:
+            return
+        self.filter(pk__in=pks).update(lifetime_loans=Greatest(F("lifetime_loans") - 1, 0), updated_at=timezone.now())
+        invalidate_stock(pks)
+
+    def _invalidate_stock(self, pks: list, emptied: bool) -> None:
+        """
+        A loan or return only drops the cached details of its books. The
+        cached list pages are dropped too when a book ran out or is back
+        on the shelf, which one indexed look-up tells.
+        """
+        invalidate_stock(pks)
+        if self.filter(pk__in=pks, inventory=0 if emptied else 1).exists():
+            invalidate_catalog()
+
+    def add_revenue(self, amounts: dict) -> None:
+        """
+        Add paid amounts, keyed by book id, in a single UPDATE ... CASE.
+        Negative amounts take refunded or cancelled payments back off.
+        """
+        if not amounts:
+            return
+        self.filter(pk__in=amounts).update(revenue=F("revenue") + Case(
+            *(When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2)
+        ))
+
+    @staticmethod
+    def _reserve_changes() -> dict:
+        return {
+            "inventory": F("inventory") - 1,
+            "on_loan": F("on_loan") + 1,
+            "lifetime_loans": F("lifetime_loans") + 1,
+            "updated_at": timezone.now(),
+        }
+
+    @staticmethod
+    def _release_changes(overdue: bool = False) -> dict:
+        # Counters are floored at zero: a loan made before they existed,
+        # or not yet counted as overdue, must not break the release.
+        changes = {
+            "inventory": F("inventory") + 1,
+            "on_loan": Greatest(F("on_loan") - 1, 0),
+            "updated_at": timezone.now(),
+        }
+        if overdue:
+            changes["overdue"] = Greatest(F("overdue") - 1, 0)
+        return changes
+
+    @transaction.atomic
+    def adjust_inventory(self, adjustments: list) -> list:
+        """
+        Apply stocktake corrections, each either a `delta` or an absolute
+        `inventory`, with one locking SELECT and one bulk UPDATE ... CASE.
+        Corrections that would leave a book below zero or point at an
+        unknown book are reported and skipped; the rest are applied.
+        Several corrections to the same book are applied in order.
+        """
+        books = self.select_for_update().only("id", "inventory").in_bulk(
+            {adjustment["book_id"] for adjustment in adjustments}
+        )
+        now = timezone.now()
+        results = []
+        changed = {}
+
+        for adjustment in adjustments:
+            book = books.get(adjustment["book_id"])
+            if book is None:
+                results.append({"book_id": adjustment["book_id"], "status": "not_found"})
+                continue
+            if "delta" in adjustment:
+                inventory = book.inventory + adjustment["delta"]
+            else:
+                inventory = adjustment["inventory"]
+            if inventory < 0:
+                results.append({
+                    "book_id": book.id,
+                    "status": "rejected",
+                    "inventory": book.inventory,
+                    "error": "Inventory cannot go below zero."
+                })
+                continue
+            book.inventory = inventory
+            book.updated_at = now
+            changed[book.id] = book
+            results.append({"book_id": book.id, "status": "updated", "inventory": inventory})
+
+        if changed:
+            self.bulk_update(changed.values(), ["inventory", "updated_at"])
+            invalidate_catalog()
+        return results
 
 
 class Book(models.Model):
@@ -12,6 +154,19 @@ class Book(models.Model):
     cover = models.CharField(max_length=50, choices=Cover)
     inventory = models.IntegerField(validators=[MinValueValidator(0)])
     daily_fee = models.DecimalField(decimal_places=2, max_digits=8)
+    updated_at = models.DateTimeField(auto_now=True)
+    on_loan = models.PositiveIntegerField(default=0)
+    overdue = models.PositiveIntegerField(default=0)
+    lifetime_loans = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(decimal_places=2, max_digits=12, default=0)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["title", "author", "cover"], name="book_edition_unique"),
+            models.CheckConstraint(condition=models.Q(inventory__gte=0), name="book_inventory_non_negative"),
+        ]
 
     def __str__(self):
         return f"Title: {self.title}, Author: {self.author}, Daily Fee {float(self.daily_fee)}"
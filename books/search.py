@@ -0,0 +1,68 @@
+import re
+
+from django.db import connection
+
+from books.models import Book
+
+
+MAX_SEARCH_TERMS = 8
+
+FTS_TABLE = "books_book_fts"
+
+# Title matches outrank author matches. The Postgres expression must stay
+# identical to the one the GIN index in 0003_book_search_index is built on;
+# the SQLite table and its sync triggers are created there as well.
+SQLITE_RANK = f"bm25({FTS_TABLE}, 10.0, 1.0)"
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('simple', books_book.title), 'A') || "
+    "setweight(to_tsvector('simple', books_book.author), 'B')"
+)
+
+
+def search_terms(query: str) -> list:
+    return re.findall(r"\w+", query.lower())[:MAX_SEARCH_TERMS]
+
+
+class BookSearch:
+    """
+    Ranked full-text search over book titles and authors. Every term is
+    matched as a prefix and all of them must match. Slicing runs one
+    LIMIT/OFFSET query against the index, so it can be paginated lazily.
+    """
+    def __init__(self, query: str):
+        self.terms = search_terms(query)
+
+    def __getitem__(self, page: slice) -> list:
+        limit, offset = page.stop - page.start, page.start
+        if not self.terms:
+            return []
+        if connection.vendor == "sqlite":
+            return self._sqlite(limit, offset)
+        if connection.vendor == "postgresql":
+            return self._postgres(limit, offset)
+        return self._fallback(limit, offset)
+
+    def _sqlite(self, limit: int, offset: int) -> list:
+        match = " ".join(f'"{term}"*' for term in self.terms)
+        return list(Book.objects.raw(
+            f"SELECT books_book.* FROM {FTS_TABLE} "
+            f"JOIN books_book ON books_book.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY {SQLITE_RANK}, books_book.id LIMIT %s OFFSET %s",
+            [match, limit, offset]
+        ))
+
+    def _postgres(self, limit: int, offset: int) -> list:
+        tsquery = " & ".join(f"{term}:*" for term in self.terms)
+        return list(Book.objects.raw(
+            f"SELECT books_book.* FROM books_book, to_tsquery('simple', %s) query "
+            f"WHERE ({POSTGRES_VECTOR}) @@ query "
+            f"ORDER BY ts_rank({POSTGRES_VECTOR}, query) DESC, books_book.id LIMIT %s OFFSET %s",
+            [tsquery, limit, offset]
+        ))
+
+    def _fallback(self, limit: int, offset: int) -> list:
+        queryset = Book.objects.order_by("id")
+        for term in self.terms:
+            queryset = queryset.filter(title__icontains=term) | queryset.filter(author__icontains=term)
+        return list(queryset[offset:offset + limit])
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 
 from books.models import Book
@@ -6,5 +7,34 @@ from books.models import Book
 class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
-        fields = ("id", "title", "author", "cover", "inventory", "daily_fee")
-        read_only_fields = ("id",)
+        fields = ("id", "title", "author", "cover", "inventory", "daily_fee", "on_loan", "overdue", "lifetime_loans")
+        read_only_fields = ("id", "on_loan", "overdue", "lifetime_loans")
+
+
+class BookImportSerializer(BookSerializer):
+    """
+    Validates one feed row without touching the database: an existing
+    edition is not an error here, the import upserts it.
+    """
+    class Meta(BookSerializer.Meta):
+        fields = ("title", "author", "cover", "inventory", "daily_fee")
+        validators = []
+
+
+class InventoryAdjustmentSerializer(serializers.Serializer):
+    book_id = serializers.IntegerField(min_value=1)
+    delta = serializers.IntegerField(required=False)
+    inventory = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if ("delta" in attrs) == ("inventory" in attrs):
+            raise serializers.ValidationError("Provide either delta or inventory.")
+        return attrs
+
+
+class BulkInventorySerializer(serializers.Serializer):
+    adjustments = serializers.ListField(
+        child=InventoryAdjustmentSerializer(),
+        allow_empty=False,
+        max_length=settings.BULK_INVENTORY_MAX_ITEMS
+    )
@@ -0,0 +1,21 @@
+import logging
+
+from celery import shared_task
+
+from books.counters import reconcile_counters, refresh_overdue_counters
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_overdue_counters_task() -> int:
+    return refresh_overdue_counters()
+
+
+@shared_task
+def reconcile_book_counters() -> dict:
+    report = reconcile_counters(fix=True)
+    if report["drifted"]:
+        logger.warning("Book counters drifted and were corrected: %s", report)
+    return report
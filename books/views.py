@@ -1,15 +1,37 @@
 from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiParameter, OpenApiExample
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
+from books.cache import catalog_cache_stats, catalog_version, get_or_build, stock_version
 from books.models import Book
 from books.permissions import IsAdminOrAllowAnyReadOnly
-from books.serializers import BookSerializer
+from books.search import BookSearch, search_terms
+from books.serializers import BookSerializer, BulkInventorySerializer
+from library_service.conditional import ConditionalGetMixin
+from library_service.db_router import ReplicaReadMixin, primary_reads
+from library_service.pagination import CatalogPagination, RankedPagination
 
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(ReplicaReadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [IsAdminOrAllowAnyReadOnly, ]
+    pagination_class = CatalogPagination
+
+    def cached_response(self, key, build_response):
+        built = []
+
+        def build():
+            # Cached under the current catalog version, so never built
+            # from a replica that has not seen the latest write.
+            with primary_reads():
+                built.append(build_response())
+            return built[0].data, built[0].status_code == status.HTTP_200_OK
+
+        data = get_or_build(key, build)
+        return built[0] if built else Response(data)
 
     @extend_schema(
         summary="Create a new Book",
@@ -84,7 +106,14 @@ class BookViewSet(viewsets.ModelViewSet):
         ]
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            request,
+            str(catalog_version()),
+            lambda: self.cached_response(
+                f"list:{self.paginator.cache_key(request)}",
+                lambda: super(BookViewSet, self).list(request, *args, **kwargs)
+            )
+        )
 
     @extend_schema(
         summary="Get a book by ID ",
@@ -110,7 +139,15 @@ class BookViewSet(viewsets.ModelViewSet):
         ]
     )
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        stock = stock_version(kwargs["pk"])
+        return self.conditional_response(
+            request,
+            f"{catalog_version()}:{stock}",
+            lambda: self.cached_response(
+                f"book:{kwargs['pk']}:{stock}",
+                lambda: super(BookViewSet, self).retrieve(request, *args, **kwargs)
+            )
+        )
 
     @extend_schema(
         summary="Update a book",
@@ -197,3 +234,122 @@ class BookViewSet(viewsets.ModelViewSet):
     )
     def partial_update(self, request, *args, **kwargs):
         return super().partial_update(request, *args, **kwargs)
+
+    @extend_schema(
+        summary="Catalog cache statistics",
+        description="Hit ratio and average lookup latency of the book catalog cache (only for admins)",
+        tags=["book"],
+        responses={
+            200: OpenApiResponse(
+                description="OK",
+                examples=[
+                    OpenApiExample(
+                        "Cache statistics",
+                        value={
+                            "hits": 950,
+                            "misses": 50,
+                            "hit_ratio": 0.95,
+                            "avg_hit_ms": 0.4,
+                            "avg_miss_ms": 6.2
+                        }
+                    )
+                ]
+            )
+        }
+    )
+    @action(detail=False, methods=["get"], url_path="cache-stats", permission_classes=[IsAdminUser])
+    def cache_stats(self, request, *args, **kwargs):
+        return Response(catalog_cache_stats())
+
+    @extend_schema(
+        summary="Search books by title and author",
+        description="Full-text search over the catalog. Every word is matched as a prefix, "
+                    "results are ordered by relevance (title matches first) and paginated "
+                    "with limit/offset",
+        tags=["book"],
+        parameters=[
+            OpenApiParameter("q", type=str, description="Search words, e.g. 'kobz shev'", required=True),
+            OpenApiParameter("limit", type=int, description="Page size", required=False),
+            OpenApiParameter("offset", type=int, description="Number of results to skip", required=False),
+        ],
+        responses={
+            200: BookSerializer(many=True),
+            400: OpenApiResponse(
+                description="Bad Request",
+                examples=[
+                    OpenApiExample(
+                        "Empty query",
+                        value={"q": ["Provide at least one word to search for."]}
+                    )
+                ]
+            )
+        }
+    )
+    @action(detail=False, methods=["get"], url_path="search", pagination_class=RankedPagination)
+    def search(self, request, *args, **kwargs):
+        query = request.query_params.get("q", "")
+        if not search_terms(query):
+            return Response(
+                {"q": ["Provide at least one word to search for."]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        def build_response():
+            page = self.paginate_queryset(BookSearch(query))
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        return self.conditional_response(request, str(catalog_version()), build_response)
+
+    @extend_schema(
+        summary="Adjust the inventory of many books at once",
+        description="Applies stocktake corrections in one transaction (only for admins). Every item gives "
+                    "either a delta or an absolute inventory. Items that would leave a book below zero "
+                    "or refer to an unknown book are skipped and reported; the others are applied",
+        tags=["book"],
+        request=BulkInventorySerializer,
+        responses={
+            200: OpenApiResponse(
+                description="OK",
+                examples=[
+                    OpenApiExample(
+                        "Per-item results",
+                        value={
+                            "updated": 1,
+                            "results": [
+                                {"book_id": 1, "status": "updated", "inventory": 12},
+                                {
+                                    "book_id": 2,
+                                    "status": "rejected",
+                                    "inventory": 1,
+                                    "error": "Inventory cannot go below zero."
+                                },
+                                {"book_id": 999, "status": "not_found"}
+                            ]
+                        }
+                    )
+                ]
+            ),
+            400: OpenApiResponse(description="Bad Request")
+        },
+        examples=[
+            OpenApiExample(
+                "application/json",
+                value={
+                    "adjustments": [
+                        {"book_id": 1, "delta": 2},
+                        {"book_id": 2, "delta": -3},
+                        {"book_id": 999, "inventory": 10}
+                    ]
+                }
+            )
+        ]
+    )
+    @action(detail=False, methods=["post"], url_path="inventory", permission_classes=[IsAdminUser])
+    def inventory(self, request, *args, **kwargs):
+        serializer = BulkInventorySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = Book.objects.adjust_inventory(serializer.validated_data["adjustments"])
+        return Response({
+            "updated": sum(result["status"] == "updated" for result in results),
+            "results": results
+        })
@@ -0,0 +1,46 @@
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+ALL_KEY = "borrowings:version"
+
+
+def _user_key(user_id) -> str:
+    return f"borrowings:version:{user_id}"
+
+
+def borrowings_version(user_id=None) -> int:
+    """
+    When the borrowings of one user, or without a user any borrowing,
+    last changed, in nanoseconds. Borrowing lists build their ETag and
+    Last-Modified from it instead of scanning the table.
+    """
+    key = ALL_KEY if user_id is None else _user_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def version_time(version: int) -> datetime:
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+
+
+def _bump(user_ids: list) -> None:
+    stamp = time.time_ns()
+    cache.set_many({ALL_KEY: stamp, **{_user_key(user_id): stamp for user_id in user_ids}}, timeout=None)
+
+
+def invalidate_borrowings(user_ids: list) -> None:
+    """
+    Call after writing borrowings of the given users. Inside a transaction
+    the versions move again on commit, so a list built from not-yet-
+    committed data in between is not answered with a 304 later.
+    """
+    _bump(user_ids)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(user_ids))
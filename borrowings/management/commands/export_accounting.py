@@ -0,0 +1,36 @@
+from argparse import ArgumentTypeError
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from borrowings.export import ENCODERS, EXPORTS, export_rows
+
+
+def parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ArgumentTypeError(f"'{value}' is not a YYYY-MM-DD date")
+
+
+class Command(BaseCommand):
+    help = "Stream borrowings or payments as CSV or NDJSON, optionally limited to a borrow date range."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=EXPORTS)
+        parser.add_argument("--output", choices=ENCODERS, default="csv")
+        parser.add_argument("--from", dest="date_from", type=parse_date)
+        parser.add_argument("--to", dest="date_to", type=parse_date)
+        parser.add_argument("--file", help="Write to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        columns, rows = export_rows(options["kind"], options["date_from"], options["date_to"])
+        lines = ENCODERS[options["output"]](columns, rows)
+
+        if not options["file"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        with open(options["file"], "w", encoding="utf-8", newline="") as export_file:
+            export_file.writelines(lines)
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("books", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Borrowing",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "borrow_date",
+                    models.DateTimeField(blank=True, default=django.utils.timezone.now),
+                ),
+                ("expected_return_date", models.DateTimeField(blank=True, null=True)),
+                ("actual_return_date", models.DateTimeField(blank=True, null=True)),
+                (
+                    "pay_status",
+                    models.CharField(
+                        blank=True,
+                        choices=[("Paid", "Paid"), ("Pending", "Pending")],
+                        default="PENDING",
+                        max_length=55,
+                        null=True,
+                    ),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="books.book"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -21,7 +21,24 @@ class Borrowing(models.Model):
         default="PENDING"
     )
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["expected_return_date"],
+                condition=models.Q(actual_return_date__isnull=True),
+                name="borrowing_open_due_idx"
+            ),
+            models.Index(fields=["user", "id"], name="borrowing_user_id_idx"),
+            models.Index(fields=["borrow_date"], name="borrowing_borrow_date_idx"),
+            models.Index(
+                fields=["actual_return_date"],
+                condition=models.Q(actual_return_date__isnull=False),
+                name="borrowing_returned_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.book.title} {self.book.author}"
@@ -1,13 +1,14 @@
+from django.conf import settings
 from django.db import transaction
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
 from books.models import Book
 from books.serializers import BookSerializer
+from borrowings.cache import invalidate_borrowings
 from borrowings.models import Borrowing
-from payments.views import create_checkout_session
-from telegram_bot.models import UserProfile
-from telegram_bot.views import send_message
+from payments.views import create_pending_payment, create_pending_payments
+from telegram_bot.outbox import queue_notification
 
 
 class BorrowingSerializer(serializers.ModelSerializer):
@@ -30,45 +31,111 @@ class BorrowingReturnSerializer(serializers.ModelSerializer):
 
 class BorrowingCreateSerializer(BorrowingSerializer):
     checkout_session = serializers.SerializerMethodField(required=False, allow_null=True)
+    payment_id = serializers.SerializerMethodField(required=False, allow_null=True)
 
     class Meta:
         model = Borrowing
-        fields = ("id", "borrow_date", "expected_return_date", "checkout_session", "book", "pay_status")
+        fields = ("id", "borrow_date", "expected_return_date", "checkout_session", "payment_id", "book", "pay_status")
         read_only_fields = ("id", "pay_status")
 
     @transaction.atomic
     def create(self, validated_data):
         user = self.context["request"].user
-        borrowing = Borrowing.objects.create(user=user, **validated_data)
-        book = borrowing.book
-        if book.inventory == 0:
-            raise ValueError("There is no this book more")
+        book = validated_data["book"]
+        if not Book.objects.reserve(book.pk):
+            raise serializers.ValidationError({"book": "There is no this book more"})
 
-        book.inventory -= 1
-        book.save()
-        borrowing.save()
+        borrowing = Borrowing.objects.create(user=user, **validated_data)
         data = \
             f"Book Title: {book.title}\n" \
             f"Book Author: {book.author}\n" \
             f"Expected return date: {borrowing.expected_return_date}\n" \
             f"Price per day: {book.daily_fee}\n"
 
-        email = user.email
-        try:
-            profile_chat_id = UserProfile.objects.get(email=email).telegram_chat_id
-            send_message(chat_id=profile_chat_id, text=f"You have new borrowing:\n{data}")
-        except UserProfile.DoesNotExist:
-            pass
+        queue_notification(email=user.email, text=f"You have new borrowing:\n{data}")
+        borrowing.payment = create_pending_payment(borrowing)
 
         return borrowing
 
     @extend_schema_field(str)
     def get_checkout_session(self, obj):
-        if isinstance(obj, Borrowing):
-            return create_checkout_session(obj.pk).url
-        return None
+        payment = getattr(obj, "payment", None)
+        if payment is None:
+            return None
+        return payment.session_url or None
+
+    @extend_schema_field(int)
+    def get_payment_id(self, obj):
+        payment = getattr(obj, "payment", None)
+        return payment.id if payment else None
 
     def validate_expected_return_date(self, value):
         if value:
             return value
         raise serializers.ValidationError("Expected return date must be provided!")
+
+
+class BulkBorrowingSerializer(serializers.Serializer):
+    book_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    expected_return_date = serializers.DateTimeField()
+
+    def validate_book_ids(self, value):
+        if len(value) > settings.BULK_BORROWING_MAX_BOOKS:
+            raise serializers.ValidationError(
+                f"You can borrow at most {settings.BULK_BORROWING_MAX_BOOKS} books at once."
+            )
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("Each book can be borrowed only once per request.")
+        return value
+
+    @transaction.atomic
+    def create(self, validated_data):
+        user = self.context["request"].user
+        book_ids = validated_data["book_ids"]
+        books = Book.objects.in_bulk(book_ids)
+        if len(books) != len(book_ids):
+            raise serializers.ValidationError({"book_ids": "Some of the given books do not exist."})
+        if not Book.objects.reserve_many(book_ids):
+            raise serializers.ValidationError({"book_ids": "Some of the given books are out of stock."})
+
+        borrowings = Borrowing.objects.bulk_create([
+            Borrowing(user=user, book=books[book_id], expected_return_date=validated_data["expected_return_date"])
+            for book_id in book_ids
+        ])
+        invalidate_borrowings([user.pk])
+        payments = create_pending_payments(borrowings)
+
+        data = "".join(
+            f"Book Title: {borrowing.book.title}\n"
+            f"Book Author: {borrowing.book.author}\n"
+            f"Price per day: {borrowing.book.daily_fee}\n"
+            for borrowing in borrowings
+        )
+        queue_notification(
+            email=user.email,
+            text=f"You have new borrowings:\n{data}"
+                 f"Expected return date: {validated_data['expected_return_date']}\n"
+        )
+
+        return {
+            "borrowings": borrowings,
+            "payment_ids": [payment.id for payment in payments],
+        }
+
+    def to_representation(self, instance):
+        return {
+            "borrowings": BorrowingSerializer(instance["borrowings"], many=True).data,
+            "payment_ids": instance["payment_ids"],
+            "checkout_session": None,
+        }
+
+
+class ExportParamsSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=["csv", "ndjson"], default="csv")
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get("date_from") and attrs.get("date_to") and attrs["date_from"] > attrs["date_to"]:
+            raise serializers.ValidationError({"date_to": "date_to must not be earlier than date_from."})
+        return attrs
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from borrowings.cache import invalidate_borrowings
+from borrowings.models import Borrowing
+
+
+@receiver(post_save, sender=Borrowing)
+@receiver(post_delete, sender=Borrowing)
+def invalidate_borrowings_on_change(sender, instance, **kwargs):
+    invalidate_borrowings([instance.user_id])
@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from borrowings.views import BorrowingView, BorrowingReturnView
+from borrowings.views import BorrowingView, BorrowingReturnView, ExportView
 
 app_name = "borrowings"
 
@@ -11,5 +11,6 @@ router.register("borrowings", BorrowingView)
 
 urlpatterns = [
     path("", include(router.urls)),
-    path("borrowings/<int:pk>/return-book/", BorrowingReturnView.as_view(), name="return-book")
+    path("borrowings/<int:pk>/return-book/", BorrowingReturnView.as_view(), name="return-book"),
+    path("export/<slug:kind>/", ExportView.as_view(), name="export")
 ]
@@ -1,7 +1,9 @@
 from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiExample, OpenApiParameter, extend_schema_view
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -9,17 +11,23 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
 from books.models import Book
+from borrowings.cache import borrowings_version, invalidate_borrowings, version_time
+from borrowings.export import CONTENT_TYPES, ENCODERS, EXPORTS, export_rows
 from borrowings.models import Borrowing
 from borrowings.serializers import (
     BorrowingSerializer,
     BorrowingReadSerializer,
     BorrowingCreateSerializer,
-    BorrowingReturnSerializer
+    BorrowingReturnSerializer,
+    BulkBorrowingSerializer,
+    ExportParamsSerializer
 )
+from library_service.conditional import ConditionalGetMixin
+from library_service.db_router import ReplicaReadMixin
 from payments.views import create_fine_checkout_session
 
 
-class BorrowingView(viewsets.ModelViewSet):
+class BorrowingView(ReplicaReadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Borrowing.objects.all()
     authentication_classes = (JWTAuthentication,)
     permission_classes = (IsAuthenticated,)
@@ -37,6 +45,8 @@ class BorrowingView(viewsets.ModelViewSet):
 
     def get_queryset(self):
         queryset = self.queryset
+        if self.action == "retrieve":
+            queryset = queryset.select_related("book")
 
         is_active = self.request.query_params.get("is_active")
         user_id = self.request.query_params.get("user_id")
@@ -54,7 +64,7 @@ class BorrowingView(viewsets.ModelViewSet):
         if user_id:
             queryset = queryset.filter(user_id=user_id)
 
-        return queryset.distinct()
+        return queryset
 
     @extend_schema(
         summary="Get a list of all Borrowings",
@@ -103,9 +113,23 @@ class BorrowingView(viewsets.ModelViewSet):
     def get(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    def list(self, request, *args, **kwargs):
+        # Staff may list anyone's borrowings, a reader only their own. The
+        # cursor and filters are part of the ETag through the request path.
+        version = borrowings_version(None if request.user.is_staff else request.user.pk)
+        return self.conditional_response(
+            request,
+            str(version),
+            lambda: super(BorrowingView, self).list(request, *args, **kwargs),
+            last_modified=version_time(version)
+        )
+
     @extend_schema(
         summary="Create a new Borrowing",
-        description="This endpoint allow you create a new Borrowing with provided data",
+        description="This endpoint allow you create a new Borrowing with provided data. "
+                    "The Stripe checkout session is opened in the background, so checkout_session "
+                    "is null at first: poll /api/payments/payment/<payment_id>/ for its session_url "
+                    "or wait for the link in Telegram",
         tags=["borrowing"],
         request=BorrowingCreateSerializer,
         responses={
@@ -173,7 +197,13 @@ class BorrowingView(viewsets.ModelViewSet):
         ]
     )
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        borrowing = self.get_object()
+        return self.conditional_response(
+            request,
+            f"{borrowing.updated_at}:{borrowing.book.updated_at}",
+            lambda: Response(self.get_serializer(borrowing).data),
+            last_modified=max(borrowing.updated_at, borrowing.book.updated_at)
+        )
 
     @extend_schema(
         summary="Update a Borrowing",
@@ -253,6 +283,68 @@ class BorrowingView(viewsets.ModelViewSet):
         kwargs["partial"] = True
         return super().partial_update(request, *args, **kwargs)
 
+    @extend_schema(
+        summary="Borrow several books at once",
+        description="Reserves every given book in one transaction, creates all Borrowings together "
+                    "and opens a single Stripe checkout session for the whole cart in the background. "
+                    "Poll any of the returned payments for its session_url",
+        tags=["borrowing"],
+        request=BulkBorrowingSerializer,
+        responses={
+            201: OpenApiResponse(
+                description="Created",
+                examples=[
+                    OpenApiExample(
+                        "Created borrowings",
+                        value={
+                            "borrowings": [
+                                {
+                                    "id": 7,
+                                    "borrow_date": "2025-06-05T14:31:00Z",
+                                    "expected_return_date": "2025-06-14T14:29:00Z",
+                                    "actual_return_date": None,
+                                    "book": 1,
+                                    "user": 2,
+                                    "pay_status": "PENDING"
+                                }
+                            ],
+                            "payment_ids": [5],
+                            "checkout_session": None
+                        }
+                    )
+                ]
+            ),
+            400: OpenApiResponse(
+                description="Bad Request",
+                examples=[
+                    OpenApiExample(
+                        "Out of stock",
+                        value={
+                            "book_ids": [
+                                "Some of the given books are out of stock."
+                            ]
+                        }
+                    )
+                ]
+            )
+        },
+        examples=[
+            OpenApiExample(
+                "application/json",
+                value={
+                    "book_ids": [1, 2, 3],
+                    "expected_return_date": "2025-12-12 00:00:00"
+                }
+            )
+        ]
+    )
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request, *args, **kwargs):
+        serializer = BulkBorrowingSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 class BorrowingReturnView(APIView):
     permission_classes = [IsAdminUser, ]
@@ -313,15 +405,22 @@ class BorrowingReturnView(APIView):
             return Response({"message": "Borrowing with given ID not exists"}, status=status.HTTP_400_BAD_REQUEST)
 
         with transaction.atomic():
-            book = Book.objects.get(pk=borrowing_obj.book.pk)
             return_date = request.data.get("actual_return_date")
 
             serializer = BorrowingReturnSerializer(data={"actual_return_date": return_date})
             if serializer.is_valid() and not borrowing_obj.actual_return_date and borrowing_obj:
                 borrowing_obj.actual_return_date = timezone.now()
-                book.inventory += 1
-                book.save()
-                borrowing_obj.save()
+                returned = Borrowing.objects.filter(
+                    pk=borrowing_obj.pk,
+                    actual_return_date__isnull=True
+                ).update(actual_return_date=borrowing_obj.actual_return_date, updated_at=timezone.now())
+                if not returned:
+                    return Response({"message": "Book was already returned"}, status.HTTP_400_BAD_REQUEST)
+                invalidate_borrowings([borrowing_obj.user_id])
+                Book.objects.release(
+                    borrowing_obj.book_id,
+                    overdue=borrowing_obj.expected_return_date < borrowing_obj.actual_return_date
+                )
                 count_of_delay_days = (borrowing_obj.expected_return_date - timezone.now()).days
                 if count_of_delay_days > 0:
                     session_fine = create_fine_checkout_session(
@@ -333,3 +432,40 @@ class BorrowingReturnView(APIView):
                     return Response({"message": "You don't have overdue!"}, status=status.HTTP_200_OK)
 
             return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+
+class ExportView(ReplicaReadMixin, APIView):
+    permission_classes = [IsAdminUser, ]
+
+    @extend_schema(
+        summary="Export borrowings or payments",
+        description="Streams every borrowing or payment, optionally limited to a borrow date range, "
+                    "as CSV or NDJSON (only for admins). Rows are sent while they are read, "
+                    "so large exports start immediately and run in flat memory",
+        tags=["borrowing"],
+        parameters=[
+            OpenApiParameter("output", type=str, enum=["csv", "ndjson"], description="Defaults to csv", required=False),
+            OpenApiParameter("date_from", type=str, description="First borrow date, YYYY-MM-DD", required=False),
+            OpenApiParameter("date_to", type=str, description="Last borrow date, YYYY-MM-DD", required=False),
+        ],
+        responses={
+            200: OpenApiResponse(description="The export file"),
+            400: OpenApiResponse(description="Bad Request"),
+            404: OpenApiResponse(description="Unknown export"),
+        }
+    )
+    def get(self, request, kind=None):
+        if kind not in EXPORTS:
+            return Response({"detail": "Unknown export"}, status=status.HTTP_404_NOT_FOUND)
+        params = ExportParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        output = params.validated_data["output"]
+
+        columns, rows = export_rows(
+            kind,
+            params.validated_data.get("date_from"),
+            params.validated_data.get("date_to")
+        )
+        response = StreamingHttpResponse(ENCODERS[output](columns, rows), content_type=CONTENT_TYPES[output])
+        response["Content-Disposition"] = f'attachment; filename="{kind}.{output}"'
+        return response
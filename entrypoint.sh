@@ -15,11 +15,13 @@ echo "WEBHOOK_URL is: $WEBHOOK_URL"
 echo "WEBHOOK_HOST is: $WEBHOOK_WITHOUT_PROTOCOL_AND_PATH"
 echo "--- The end of the checking ---"
 
-if [ "$1" = "python" ] && [ "$2" = "manage.py" ] && [ "$3" = "runserver" ]; then
+if [ "$1" = "gunicorn" ] || { [ "$1" = "python" ] && [ "$2" = "manage.py" ] && [ "$3" = "runserver" ]; }; then
     echo "Execution of migration..."
     python manage.py migrate
+    python manage.py collectstatic --noinput
     python /app/telegram_bot/set_webhook.py
     python manage.py loaddata fixture.json
+    python manage.py reconcile_book_counters
 
 fi
 
@@ -0,0 +1,81 @@
+"""
+Production web server settings, read by `gunicorn -c gunicorn.conf.py`.
+
+Every view is synchronous, so the default is WSGI with threaded workers.
+Set GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker to serve
+library_service/asgi.py instead; Django then runs the sync views one at a
+time per worker, so it needs more workers for the same throughput.
+"""
+import os
+import shutil
+import tempfile
+
+
+def _int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _available_cpus() -> int:
+    """
+    CPUs this container may use: its CPU affinity, lowered to the cgroup
+    CPU quota (`docker run --cpus`) if there is one. cpu_count() would
+    report every CPU of the host.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, -(-int(quota) // int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+# Every worker thread may hold its own PostgreSQL connection, so the
+# default is capped: 8 workers of 4 threads stay well inside the default
+# max_connections of 100, next to the Celery workers.
+MAX_DEFAULT_WORKERS = 8
+
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8100")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = _int("GUNICORN_WORKERS", min(_available_cpus() * 2 + 1, MAX_DEFAULT_WORKERS))
+threads = _int("GUNICORN_THREADS", 4)
+keepalive = _int("GUNICORN_KEEPALIVE", 5)
+timeout = _int("GUNICORN_TIMEOUT", 30)
+graceful_timeout = _int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+# Recycle workers now and then so a slow leak cannot grow forever; the
+# jitter keeps them from all restarting at once. A fresh worker serves its
+# first requests slowly and drops its keep-alive connections, so not too
+# often: at 1000, server_throughput.py lost over a third of its throughput.
+max_requests = _int("GUNICORN_MAX_REQUESTS", 10000)
+max_requests_jitter = _int("GUNICORN_MAX_REQUESTS_JITTER", 1000)
+
+wsgi_app = (
+    "library_service.asgi:application" if "uvicorn" in worker_class.lower()
+    else "library_service.wsgi:application"
+)
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+forwarded_allow_ips = os.environ.get("GUNICORN_FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+# Each worker keeps its own Prometheus values; in multiprocess mode they
+# are written to files here and /metrics/ adds up all the workers. The
+# variable has to be set before the workers import prometheus_client.
+prometheus_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "library-prometheus")
+)
+
+
+def on_starting(server):
+    # Start from zero: files left by an earlier run would be added in.
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
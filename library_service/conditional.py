@@ -0,0 +1,29 @@
+import hashlib
+from datetime import datetime
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETag / Last-Modified support for views whose freshness can be
+    told from a cheap fingerprint (a version counter or a max timestamp).
+    When the client already holds the current representation, a 304 is
+    returned without building the response at all.
+    """
+    def conditional_response(self, request, fingerprint: str, build_response, last_modified: datetime = None):
+        etag = quote_etag(hashlib.sha256(
+            f"{request.user.pk}:{request.get_full_path()}:{fingerprint}".encode()
+        ).hexdigest())
+        last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified_ts)
+        if response is None:
+            response = build_response()
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response.headers["ETag"] = etag
+            if last_modified_ts is not None:
+                response.headers["Last-Modified"] = http_date(last_modified_ts)
+        return response
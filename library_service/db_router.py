@@ -0,0 +1,129 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+class RoutingState:
+    """
+    Whether the code running now may read from a replica. Reads stay on
+    the primary unless a view or task opted in, and, for requests, once
+    the request itself has written.
+    """
+    def __init__(self, replica_reads: bool = False, follow_writes: bool = True):
+        self.replica_reads = replica_reads
+        self.follow_writes = follow_writes
+        self.wrote = False
+
+
+routing_state: ContextVar = ContextVar("routing_state", default=None)
+
+
+def pin_key(user_id) -> str:
+    return f"db:pinned:{user_id}"
+
+
+def is_pinned(user) -> bool:
+    return bool(user and user.is_authenticated and cache.get(pin_key(user.pk)))
+
+
+def choose_replica() -> str:
+    return random.choice(settings.REPLICA_DATABASES)
+
+
+class ReplicaRouter:
+    """
+    Sends reads that opted in to one of REPLICA_DATABASES and everything
+    else to the primary. Replicas are migrated by replication, never by
+    Django.
+    """
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if (
+            state is None
+            or not state.replica_reads
+            or (state.follow_writes and state.wrote)
+            or not settings.REPLICA_DATABASES
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return None
+        return choose_replica()
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary for a while, even in a view that opted in: what
+    is built here outlives the request, e.g. a cached page, and must not
+    be built from a replica that is still catching up.
+    """
+    state = routing_state.get()
+    previous = state.replica_reads if state is not None else None
+    if state is not None:
+        state.replica_reads = False
+    try:
+        yield
+    finally:
+        if state is not None:
+            state.replica_reads = previous
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Give every request its own routing state and, when the request wrote,
+    pin its user to the primary for REPLICA_STICKINESS_SECONDS, so that
+    they read their own writes while the replicas catch up.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState()
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+
+        user = getattr(request, "user", None)
+        if state.wrote and settings.REPLICA_DATABASES and user is not None and user.is_authenticated:
+            cache.set(pin_key(user.pk), True, timeout=settings.REPLICA_STICKINESS_SECONDS)
+        return response
+
+
+class ReplicaReadMixin:
+    """
+    Serve the safe methods of a view from a replica, unless its user is
+    pinned to the primary after a recent write.
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        state = routing_state.get()
+        if (
+            state is not None
+            and settings.REPLICA_DATABASES
+            and request.method in SAFE_METHODS
+            and not is_pinned(request.user)
+        ):
+            state.replica_reads = True
@@ -0,0 +1,116 @@
+import hmac
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    """
+    What one request spent its time on. The middleware puts one in
+    `current_request` and the database and external-call hooks add to it.
+    """
+    def __init__(self, collect_sql: bool = False):
+        self.queries = 0
+        self.db_time = 0.0
+        self.external = {}
+        self.sql = [] if collect_sql else None
+
+    @property
+    def external_time(self) -> float:
+        return sum(elapsed for _, elapsed in self.external.values())
+
+    def add_query(self, sql: str, elapsed: float) -> None:
+        self.queries += 1
+        self.db_time += elapsed
+        if self.sql is not None:
+            self.sql.append((elapsed, sql))
+
+    def add_external(self, service: str, elapsed: float) -> None:
+        calls, total = self.external.get(service, (0, 0.0))
+        self.external[service] = (calls + 1, total + elapsed)
+
+
+current_request: ContextVar = ContextVar("current_request", default=None)
+
+
+# With PROMETHEUS_MULTIPROC_DIR set (as under gunicorn), every worker
+# process writes its values to files there and a scrape adds them all up,
+# so whichever worker answers, Prometheus sees the totals of the service.
+HTTP_REQUESTS = Counter(
+    "library_http_requests", "Requests served", ["view", "method", "status"]
+)
+HTTP_DURATION = Histogram(
+    "library_http_request_duration_seconds", "Request duration", ["view", "method"], buckets=DURATION_BUCKETS
+)
+DB_QUERIES = Counter("library_db_queries", "SQL queries run by requests", ["view", "method"])
+DB_SECONDS = Counter("library_db_seconds", "Time requests spent in SQL", ["view", "method"])
+EXTERNAL_CALLS = Counter("library_external_calls", "Calls to external APIs", ["service"])
+EXTERNAL_DURATION = Histogram(
+    "library_external_call_duration_seconds", "External API call duration", ["service"], buckets=DURATION_BUCKETS
+)
+CATALOG_CACHE_LOOKUPS = Counter("library_catalog_cache_lookups", "Catalog cache lookups", ["result"])
+CATALOG_CACHE_SECONDS = Counter(
+    "library_catalog_cache_lookup_seconds", "Time spent in catalog cache lookups", ["result"]
+)
+
+
+def scrape_registry():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def sample_value(name: str, labels: dict = None) -> float:
+    """
+    The current value of one sample, summed over the worker processes in
+    multiprocess mode.
+    """
+    return scrape_registry().get_sample_value(name, labels or {}) or 0
+
+
+def record_request(view: str, method: str, status: int, elapsed: float, metrics: RequestMetrics) -> None:
+    HTTP_REQUESTS.labels(view, method, f"{status // 100}xx").inc()
+    HTTP_DURATION.labels(view, method).observe(elapsed)
+    DB_QUERIES.labels(view, method).inc(metrics.queries)
+    DB_SECONDS.labels(view, method).inc(metrics.db_time)
+
+
+@contextmanager
+def track_external(service: str):
+    """
+    Time a call to an external API (Stripe, Telegram) for the metrics and
+    for the Server-Timing header of the request making it, if any.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        EXTERNAL_CALLS.labels(service).inc()
+        EXTERNAL_DURATION.labels(service).observe(elapsed)
+        metrics = current_request.get()
+        if metrics is not None:
+            metrics.add_external(service, elapsed)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. The scraper has to send METRICS_TOKEN as a
+    bearer token; while no token is configured the endpoint stays closed.
+    """
+    token = settings.METRICS_TOKEN
+    if not token or not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(scrape_registry()), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,74 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from library_service.metrics import RequestMetrics, current_request, record_request
+
+
+logger = logging.getLogger("library_service.slow_requests")
+
+
+class InstrumentationMiddleware:
+    """
+    Count the SQL queries, database time and external API time of every
+    request, report them in a Server-Timing header and the metrics
+    registry, and log requests slower than SLOW_REQUEST_MS with their SQL.
+    Keep it first in MIDDLEWARE so the total covers the other middleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slow_request_ms = settings.SLOW_REQUEST_MS
+        metrics = RequestMetrics(collect_sql=bool(slow_request_ms))
+        token = current_request.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self.time_query))
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else "unmatched"
+        record_request(view, request.method, response.status_code, elapsed, metrics)
+        response["Server-Timing"] = server_timing(metrics, elapsed)
+
+        if slow_request_ms and elapsed * 1000 >= slow_request_ms:
+            slowest = sorted(metrics.sql, reverse=True)[:settings.SLOW_REQUEST_LOGGED_QUERIES]
+            logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries in %.0f ms, external %.0f ms\n%s",
+                request.method,
+                request.get_full_path(),
+                view,
+                elapsed * 1000,
+                metrics.queries,
+                metrics.db_time * 1000,
+                metrics.external_time * 1000,
+                "\n".join(f"  {query_time * 1000:.1f} ms: {sql}" for query_time, sql in slowest)
+            )
+        return response
+
+    @staticmethod
+    def time_query(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics = current_request.get()
+            if metrics is not None:
+                metrics.add_query(sql, time.perf_counter() - started)
+
+
+def server_timing(metrics: RequestMetrics, elapsed: float) -> str:
+    entries = [f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"']
+    for service, (calls, service_time) in sorted(metrics.external.items()):
+        entries.append(f'{service};dur={service_time * 1000:.1f};desc="{calls} calls"')
+    entries.append(f"total;dur={elapsed * 1000:.1f}")
+    return ", ".join(entries)
@@ -0,0 +1,71 @@
+from django.conf import settings
+from collections import OrderedDict
+
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the primary key: every page is an index range
+    scan, however deep the client pages, and rows never shift between pages.
+    """
+    ordering = "id"
+    page_size_query_param = "page_size"
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+class CatalogPagination(IdCursorPagination):
+    """
+    Cursor pages for the cached catalog. A cached page may be served to any
+    request with the same cursor and page size, so its links keep only the
+    pagination parameters and never echo another client's query string.
+    """
+    def cache_key(self, request) -> str:
+        cursor = request.query_params.get(self.cursor_query_param, "")
+        return f"{request.get_host()}{request.path}:{self.get_page_size(request)}:{cursor}"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = super().paginate_queryset(queryset, request, view)
+        self.base_url = request.build_absolute_uri(request.path)
+        if self.page_size_query_param in request.query_params:
+            self.base_url = replace_query_param(self.base_url, self.page_size_query_param, self.page_size)
+        return page
+
+
+class RankedPagination(LimitOffsetPagination):
+    """
+    Limit/offset pages for relevance-ordered results, which have no stable
+    key to paginate on. It fetches one extra row to tell whether there is a
+    next page instead of counting every match.
+    """
+    max_limit = settings.MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        rows = queryset[self.offset:self.offset + self.limit + 1]
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        del response_schema["properties"]["count"]
+        response_schema["required"] = ["results"]
+        return response_schema
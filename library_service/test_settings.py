@@ -0,0 +1,25 @@
+"""
+Settings for the test suite. Other runners (pytest-django and the like)
+pick them up through DJANGO_SETTINGS_MODULE.
+
+    python manage.py test --settings=library_service.test_settings
+"""
+import os
+
+os.environ.setdefault("SECRET_KEY", "tests")
+os.environ.setdefault("STRIPE_PUBLIC_KEY", "pk_test")
+os.environ.setdefault("STRIPE_PRIVATE_KEY", "sk_test")
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("WEBHOOK_WITHOUT_PROTOCOL_AND_PATH", "tests.local")
+
+from library_service.settings import *  # noqa: E402,F401,F403
+
+
+# Every test process gets its own cache, whatever CACHE_URL says, so
+# cached catalog pages and versions never leak between tests and runs
+# through a shared Redis.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
@@ -19,6 +19,8 @@ from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from library_service.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/library/", include("books.urls", namespace="books")),
@@ -26,6 +28,8 @@ urlpatterns = [
     path("api/administration/", include("borrowings.urls", namespace="borrowings")),
     path("api/", include("telegram_bot.urls", namespace="telegram_bot")),
     path("api/payments/", include("payments.urls", namespace="payments")),
+    path("api/analytics/", include("analytics.urls", namespace="analytics")),
+    path("metrics/", metrics_view, name="metrics"),
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/schema/swagger-ui/", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
     path("api/schema/redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc")
@@ -0,0 +1,178 @@
+"""
+Local stand-ins for the Stripe checkout API and the Telegram Bot API, so
+the service can be load tested without touching either. Point the service
+at it with
+
+    STRIPE_API_BASE=http://localhost:12111
+    TELEGRAM_API_BASE=http://localhost:12111
+
+and run
+
+    python loadtest/fake_services.py --latency-ms 120 --jitter-ms 40 --telegram-429-rate 0.02
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+SESSION_PATH = re.compile(r"^/v1/checkout/sessions/(?P<session_id>[\w-]+)$")
+SEND_MESSAGE_PATH = re.compile(r"^/bot[^/]+/sendMessage$")
+
+
+class FakeServices:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, stripe_429_rate=0.0, telegram_429_rate=0.0, retry_after=1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.stripe_429_rate = stripe_429_rate
+        self.telegram_429_rate = telegram_429_rate
+        self.retry_after = retry_after
+        self.sessions = {}
+        self.session_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def delay(self) -> None:
+        latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def create_session(self, form: dict, base_url: str) -> dict:
+        amount = sum(
+            int(values[0]) for key, values in form.items()
+            if key.startswith("line_items[") and key.endswith("[price_data][unit_amount]")
+        )
+        with self.lock:
+            session_id = f"cs_fake_{next(self.session_ids)}"
+            session = self.sessions[session_id] = {
+                "id": session_id,
+                "object": "checkout.session",
+                "url": f"{base_url}/pay/{session_id}",
+                "payment_status": "unpaid",
+                "status": "open",
+                "amount_total": amount,
+                "currency": "usd",
+            }
+        return session
+
+    def retrieve_session(self, session_id: str) -> dict:
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            # The customer always pays by the time they come back.
+            session.update(payment_status="paid", status="complete")
+            return dict(session)
+
+
+def make_handler(services: FakeServices):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def reply(self, status: int, payload: dict, headers: dict = None) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def form(self) -> dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            return parse_qs(self.rfile.read(length).decode())
+
+        def stripe_rate_limited(self) -> bool:
+            if random.random() >= services.stripe_429_rate:
+                return False
+            self.reply(429, {"error": {"type": "invalid_request_error", "code": "rate_limit",
+                                       "message": "Too many requests (fake)"}})
+            return True
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            form = self.form()
+            services.delay()
+
+            if path == "/v1/checkout/sessions":
+                if not self.stripe_rate_limited():
+                    base_url = f"http://{self.headers.get('Host', 'localhost')}"
+                    self.reply(200, services.create_session(form, base_url))
+            elif SEND_MESSAGE_PATH.match(path):
+                if random.random() < services.telegram_429_rate:
+                    self.reply(429, {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {services.retry_after}",
+                        "parameters": {"retry_after": services.retry_after},
+                    })
+                else:
+                    chat_id = (form.get("chat_id") or [""])[0]
+                    text = (form.get("text") or [""])[0]
+                    self.reply(200, {"ok": True, "result": {"chat": {"id": chat_id}, "text": text}})
+            else:
+                self.reply(404, {"error": {"message": f"Unknown path {path}"}})
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            match = SESSION_PATH.match(path)
+            services.delay()
+
+            if match:
+                if not self.stripe_rate_limited():
+                    session = services.retrieve_session(match["session_id"])
+                    if session is None:
+                        self.reply(404, {"error": {"type": "invalid_request_error",
+                                                   "message": f"No such checkout.session: {match['session_id']}"}})
+                    else:
+                        self.reply(200, session)
+            else:
+                self.reply(404, {"error": {"message": f"Unknown path {path}"}})
+
+    return Handler
+
+
+def serve(host: str, port: int, services: FakeServices) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(services))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Stripe checkout and Telegram Bot API for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform +- spread around the latency")
+    parser.add_argument("--stripe-429-rate", type=float, default=0, help="Share of Stripe calls answered 429")
+    parser.add_argument("--telegram-429-rate", type=float, default=0, help="Share of sendMessage calls answered 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after of Telegram 429s, in seconds")
+    args = parser.parse_args()
+
+    services = FakeServices(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        stripe_429_rate=args.stripe_429_rate,
+        telegram_429_rate=args.telegram_429_rate,
+        retry_after=args.retry_after,
+    )
+    server = serve(args.host, args.port, services)
+    print(f"Fake Stripe and Telegram listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Compare the throughput of the development server with the production
+gunicorn setups. Each server is started in turn on the current settings
+and database, hammered by closed-loop clients for a fixed time, and
+stopped; requests per second and latency percentiles are reported.
+
+    python loadtest/server_throughput.py --servers runserver gunicorn uvicorn --concurrency 16 --duration 20
+
+Migrate and load data first; the default path is the public book list.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from traffic import percentile
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def server_command(name: str, port: int) -> tuple:
+    env = dict(os.environ)
+    if name == "runserver":
+        return [sys.executable, "manage.py", "runserver", f"127.0.0.1:{port}", "--noreload"], env
+    env["GUNICORN_BIND"] = f"127.0.0.1:{port}"
+    env["GUNICORN_ACCESS_LOG"] = "/dev/null"
+    if name == "uvicorn":
+        env["GUNICORN_WORKER_CLASS"] = "uvicorn.workers.UvicornWorker"
+    return ["gunicorn", "-c", "gunicorn.conf.py"], env
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"The server exited with code {process.returncode}")
+        try:
+            if requests.get(url, timeout=2).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} did not answer within {timeout:.0f} s")
+
+
+def hammer(url: str, concurrency: int, duration: float) -> dict:
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        session = requests.Session()
+        own, failed = [], 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = session.get(url, timeout=30).status_code < 400
+            except requests.RequestException:
+                ok = False
+            own.append(time.perf_counter() - started)
+            failed += not ok
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "requests_per_s": len(latencies) / elapsed,
+        "error_rate": errors[0] / len(latencies) if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else 0.0,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare runserver with the gunicorn setups.")
+    parser.add_argument("--servers", nargs="+", default=["runserver", "gunicorn", "uvicorn"],
+                        choices=["runserver", "gunicorn", "uvicorn"])
+    parser.add_argument("--path", default="/api/library/book/")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--port", type=int, default=8200)
+    args = parser.parse_args()
+
+    results = {}
+    for number, name in enumerate(args.servers):
+        port = args.port + number
+        url = f"http://127.0.0.1:{port}{args.path}"
+        command, env = server_command(name, port)
+        process = subprocess.Popen(
+            command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+        )
+        try:
+            wait_until_ready(url, process)
+            hammer(url, args.concurrency, args.warmup)
+            results[name] = hammer(url, args.concurrency, args.duration)
+        finally:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=30)
+        print(f"{name}: {results[name]['requests_per_s']:.1f} req/s", file=sys.stderr)
+
+    header = f"{'server':<12}{'requests':>10}{'req/s':>10}{'errors':>9}{'p50 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, row in results.items():
+        print(
+            f"{name:<12}{row['requests']:>10}{row['requests_per_s']:>10.1f}{row['error_rate']:>8.1%} "
+            f"{row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Replay a realistic mix of catalog browsing, borrowing, paying and returning
+against a running service at a target request rate, and report p50/p95/p99
+latency and error rates per endpoint. Run the service against
+loadtest/fake_services.py first, so no borrowing reaches Stripe or Telegram.
+
+    python loadtest/traffic.py --base-url http://localhost:8100 --rps 50 --duration 120 \\
+        --mix browse=70,borrow=10,pay=10,return=10 --json results.json
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+
+DEFAULT_MIX = "browse=70,borrow=10,pay=10,return=10"
+PASSWORD = "loadtest-password"
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint: str, elapsed: float, ok: bool) -> None:
+        with self.lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report(self) -> dict:
+        with self.lock:
+            return {
+                endpoint: {
+                    "requests": len(latencies),
+                    "errors": self.errors[endpoint],
+                    "error_rate": self.errors[endpoint] / len(latencies),
+                    "p50_ms": percentile(latencies, 50) * 1000,
+                    "p95_ms": percentile(latencies, 95) * 1000,
+                    "p99_ms": percentile(latencies, 99) * 1000,
+                    "max_ms": max(latencies) * 1000,
+                }
+                for endpoint, latencies in sorted(self.latencies.items())
+            }
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Traffic:
+    """
+    The scenarios and the state they share: borrowings waiting to be paid
+    and paid borrowings waiting to be returned.
+    """
+    def __init__(self, base_url: str, recorder: Recorder, rng: random.Random, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.rng = rng
+        self.timeout = timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.to_pay = deque()
+        self.to_return = deque()
+        self.readers = []
+        self.admin_token = None
+        self.book_ids = []
+        self.search_words = []
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def start(self, scenario, scheduled: float) -> None:
+        """
+        Run a scenario whose first request should have gone out at
+        `scheduled`, so time spent waiting for a free worker counts
+        against its latency instead of being silently omitted.
+        """
+        self.local.scheduled = scheduled
+        try:
+            scenario()
+        finally:
+            self.local.scheduled = None
+
+    def call(self, method: str, endpoint: str, path: str, token: str = None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        started = getattr(self.local, "scheduled", None) or time.perf_counter()
+        self.local.scheduled = None
+        try:
+            response = self.session.request(
+                method, self.base_url + path, headers=headers, timeout=self.timeout, **kwargs
+            )
+        except requests.RequestException:
+            self.recorder.record(f"{method} {endpoint}", time.perf_counter() - started, ok=False)
+            return None
+        self.recorder.record(f"{method} {endpoint}", time.perf_counter() - started, ok=response.status_code < 400)
+        return response
+
+    def token(self, email: str, password: str) -> str:
+        response = self.session.post(
+            f"{self.base_url}/api/user/token/", json={"email": email, "password": password}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()["access"]
+
+    def setup(self, readers: int, admin_email: str, admin_password: str) -> None:
+        self.admin_token = self.token(admin_email, admin_password)
+        run = uuid.uuid4().hex[:8]
+        for i in range(readers):
+            email = f"loadtest-{run}-{i}@example.com"
+            response = self.session.post(
+                f"{self.base_url}/api/user/register/", json={"email": email, "password": PASSWORD},
+                timeout=self.timeout
+            )
+            response.raise_for_status()
+            self.readers.append(self.token(email, PASSWORD))
+
+        response = self.session.get(
+            f"{self.base_url}/api/library/book/", params={"page_size": 500},
+            headers={"Authorization": f"Bearer {self.admin_token}"}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        books = response.json()["results"]
+        if not books:
+            raise SystemExit("The catalog is empty, load a fixture or import books first.")
+        self.book_ids = [book["id"] for book in books]
+        self.search_words = sorted({word for book in books for word in book["title"].split() if len(word) > 3})
+
+    def browse(self) -> None:
+        reader = self.rng.choice(self.readers)
+        self.call("GET", "/api/library/book/", "/api/library/book/", reader,
+                  params={"page_size": self.rng.choice([20, 50])})
+        if self.rng.random() < 0.5:
+            book_id = self.rng.choice(self.book_ids)
+            self.call("GET", "/api/library/book/{id}/", f"/api/library/book/{book_id}/", reader)
+        if self.search_words and self.rng.random() < 0.3:
+            self.call("GET", "/api/library/book/search/", "/api/library/book/search/", reader,
+                      params={"q": self.rng.choice(self.search_words)})
+
+    def borrow(self) -> None:
+        reader = self.rng.choice(self.readers)
+        expected_return_date = datetime.now(timezone.utc) + timedelta(days=self.rng.randint(7, 21))
+        response = self.call(
+            "POST", "/api/administration/borrowings/", "/api/administration/borrowings/", reader,
+            json={"book": self.rng.choice(self.book_ids), "expected_return_date": expected_return_date.isoformat()}
+        )
+        if response is not None and response.status_code == 201:
+            with self.lock:
+                self.to_pay.append((reader, response.json()["id"], response.json()["payment_id"]))
+
+    def pay(self) -> None:
+        with self.lock:
+            if not self.to_pay:
+                return self.browse()
+            reader, borrowing_id, payment_id = self.to_pay.popleft()
+        response = self.call("GET", "/api/payments/payment/{id}/", f"/api/payments/payment/{payment_id}/", reader)
+        session_id = response.json().get("session_id") if response is not None and response.ok else None
+        if not session_id:
+            # The checkout session is opened by a worker; try again later.
+            with self.lock:
+                self.to_pay.append((reader, borrowing_id, payment_id))
+            return
+        response = self.call("GET", "/api/payments/success-pay/", "/api/payments/success-pay/", reader,
+                             params={"session_id": session_id})
+        if response is not None and response.ok:
+            with self.lock:
+                self.to_return.append(borrowing_id)
+
+    def return_book(self) -> None:
+        with self.lock:
+            if not self.to_return:
+                return self.browse()
+            borrowing_id = self.to_return.popleft()
+        self.call(
+            "POST", "/api/administration/borrowings/{id}/return-book/",
+            f"/api/administration/borrowings/{borrowing_id}/return-book/", self.admin_token
+        )
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("browse", "borrow", "pay", "return"):
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name!r}")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def run(traffic: Traffic, mix: dict, rps: float, duration: float, workers: int) -> dict:
+    """
+    Start scenarios on an open-loop schedule, so a slow service does not
+    lower the offered load; the lag behind the schedule is reported. The
+    first request of each scenario is timed from its scheduled start.
+    """
+    scenarios = {
+        "browse": traffic.browse, "borrow": traffic.borrow, "pay": traffic.pay, "return": traffic.return_book
+    }
+    names, weights = zip(*mix.items())
+    interval = 1 / rps
+    started = time.perf_counter()
+    max_lag = 0.0
+    count = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            scheduled = started + count * interval
+            if scheduled - started >= duration:
+                break
+            now = time.perf_counter()
+            if scheduled > now:
+                time.sleep(scheduled - now)
+            else:
+                max_lag = max(max_lag, now - scheduled)
+            executor.submit(traffic.start, scenarios[traffic.rng.choices(names, weights)[0]], scheduled)
+            count += 1
+    elapsed = time.perf_counter() - started
+    return {"scenarios": count, "elapsed_s": elapsed, "scenarios_per_s": count / elapsed, "max_lag_ms": max_lag * 1000}
+
+
+def print_report(summary: dict, endpoints: dict) -> None:
+    print(
+        f"\n{summary['scenarios']} scenarios in {summary['elapsed_s']:.1f} s "
+        f"({summary['scenarios_per_s']:.1f}/s, max schedule lag {summary['max_lag_ms']:.0f} ms)\n"
+    )
+    header = f"{'endpoint':<58}{'requests':>9}{'errors':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, row in endpoints.items():
+        print(
+            f"{endpoint:<58}{row['requests']:>9}{row['error_rate']:>8.1%} "
+            f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_ms']:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a realistic traffic mix against the library service.")
+    parser.add_argument("--base-url", default="http://localhost:8100")
+    parser.add_argument("--rps", type=float, default=20, help="Scenarios started per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Scenario weights, default {DEFAULT_MIX}")
+    parser.add_argument("--workers", type=int, default=64, help="Concurrent scenarios at most")
+    parser.add_argument("--readers", type=int, default=20, help="Reader accounts to register and spread load over")
+    parser.add_argument("--admin-email", default="alice_admin@example.com")
+    parser.add_argument("--admin-password", default="1qazcde3")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    traffic = Traffic(args.base_url, recorder, random.Random(args.seed), args.timeout)
+    traffic.setup(args.readers, args.admin_email, args.admin_password)
+    summary = run(traffic, args.mix, args.rps, args.duration, args.workers)
+    endpoints = recorder.report()
+    print_report(summary, endpoints)
+
+    if args.json_path:
+        with open(args.json_path, "w") as file:
+            json.dump({"summary": summary, "endpoints": endpoints}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="Payment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        blank=True,
+                        choices=[("Pending", "Pending"), ("Paid", "Paid")],
+                        default="PENDING",
+                        max_length=255,
+                        null=True,
+                    ),
+                ),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[("Payment", "Payment"), ("Fine", "Fine")],
+                        max_length=255,
+                    ),
+                ),
+                ("borrowing_id", models.IntegerField()),
+                ("session_url", models.URLField(max_length=255)),
+                ("session_id", models.CharField(max_length=255)),
+                ("money_to_pay", models.DecimalField(decimal_places=2, max_digits=8)),
+            ],
+        ),
+    ]
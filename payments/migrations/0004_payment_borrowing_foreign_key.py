@@ -0,0 +1,49 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def detach_orphaned_payments(apps, schema_editor):
+    Borrowing = apps.get_model("borrowings", "Borrowing")
+    Payment = apps.get_model("payments", "Payment")
+    Payment.objects.exclude(borrowing_id__in=Borrowing.objects.values("id")).update(borrowing_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0002_hot_lookup_indexes"),
+        ("payments", "0003_hot_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="payment",
+            name="payment_borrowing_id_idx",
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="borrowing_id",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(detach_orphaned_payments, migrations.RunPython.noop),
+        migrations.RenameField(
+            model_name="payment",
+            old_name="borrowing_id",
+            new_name="borrowing",
+        ),
+        migrations.AlterField(
+            model_name="payment",
+            name="borrowing",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="payments",
+                to="borrowings.borrowing",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["borrowing"], name="payment_borrowing_id_idx"),
+        ),
+    ]
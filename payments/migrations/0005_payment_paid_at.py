@@ -0,0 +1,44 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_paid_at(apps, schema_editor):
+    """
+    Payments were not stamped when paid, so date the old ones from their
+    borrowing: a loan is paid for at checkout, right after it is borrowed,
+    and a fine when the book comes back. Payments whose borrowing was
+    deleted keep no date and stay out of the rollups.
+    """
+    Borrowing = apps.get_model("borrowings", "Borrowing")
+    Payment = apps.get_model("payments", "Payment")
+
+    borrowing = Borrowing.objects.filter(pk=OuterRef("borrowing_id"))
+    paid = Payment.objects.filter(status__in=("Paid", "PAID"), paid_at__isnull=True, borrowing__isnull=False)
+    fines = ("Fine", "FINE")
+
+    paid.exclude(type__in=fines).update(paid_at=Subquery(borrowing.values("borrow_date")[:1]))
+    paid.filter(type__in=fines).update(paid_at=Subquery(
+        borrowing.values(paid_at=Coalesce("actual_return_date", "borrow_date"))[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("borrowings", "0004_rollup_date_indexes"),
+        ("payments", "0004_payment_borrowing_foreign_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="paid_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["paid_at"], name="payment_paid_at_idx"),
+        ),
+        migrations.RunPython(backfill_paid_at, migrations.RunPython.noop),
+    ]
@@ -11,7 +11,27 @@ class Payment(models.Model):
 
     status = models.CharField(max_length=255, choices=StatusChoices, blank=True, null=True, default="PENDING")
     type = models.CharField(max_length=255, choices=TypeChoices)
-    borrowing_id = models.IntegerField()
-    session_url = models.URLField(max_length=255)
-    session_id = models.CharField(max_length=255)
+    borrowing = models.ForeignKey(
+        "borrowings.Borrowing",
+        on_delete=models.SET_NULL,
+        null=True,
+        db_index=False,
+        related_name="payments"
+    )
+    session_url = models.URLField(max_length=255, blank=True)
+    session_id = models.CharField(max_length=255, blank=True)
     money_to_pay = models.DecimalField(decimal_places=2, max_digits=8)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["session_id"], name="payment_session_id_idx"),
+            models.Index(fields=["borrowing"], name="payment_borrowing_id_idx"),
+            models.Index(fields=["paid_at"], name="payment_paid_at_idx"),
+        ]
+
+
+# The Stripe callbacks have always stored "PAID" and "FINE" rather than the
+# choice values, while fixtures use the choice values.
+PAID_STATUSES = (Payment.StatusChoices.PAID, "PAID")
+FINE_TYPES = (Payment.TypeChoices.FINE, "FINE")
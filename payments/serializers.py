@@ -5,6 +5,8 @@ from payments.models import Payment
 
 
 class PaymentSerializer(serializers.ModelSerializer):
+    borrowing_id = serializers.IntegerField(read_only=True, allow_null=True)
+
     class Meta:
         model = Payment
         fields = ("id", "status", "type", "borrowing_id", "session_url", "session_id", "money_to_pay")
@@ -0,0 +1,27 @@
+import stripe
+from celery import shared_task
+
+from payments.models import Payment
+from payments.views import open_checkout_session
+from telegram_bot.outbox import queue_notification
+
+
+@shared_task(autoretry_for=(stripe.StripeError,), retry_backoff=True, max_retries=5)
+def open_checkout_session_task(payment_ids: list) -> str:
+    payments = list(
+        Payment.objects
+        .select_related("borrowing__book", "borrowing__user")
+        .filter(id__in=payment_ids, borrowing__isnull=False)
+        .order_by("id")
+    )
+    if not payments or payments[0].session_url:
+        return payments[0].session_url if payments else ""
+
+    titles = [payment.borrowing.book.title for payment in payments]
+    session = open_checkout_session(list(zip(payments, titles)))
+    quoted_titles = ", ".join(f"'{title}'" for title in titles)
+    queue_notification(
+        email=payments[0].borrowing.user.email,
+        text=f"Your payment link for {quoted_titles} is ready:\n{session.url}"
+    )
+    return session.url
@@ -1,6 +1,12 @@
+from collections import defaultdict
+from decimal import Decimal
+
 import environ
 import stripe
-from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
 from drf_spectacular.utils import OpenApiExample, OpenApiResponse, extend_schema
 from rest_framework import mixins, status
 from rest_framework.generics import GenericAPIView
@@ -8,14 +14,17 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from books.models import Book
+from library_service.db_router import ReplicaReadMixin
+from library_service.metrics import track_external
+from borrowings.cache import invalidate_borrowings
 from borrowings.models import Borrowing
-from payments.models import Payment
+from payments.models import PAID_STATUSES, Payment
 from payments.serializers import (
     PaymentSerializer,
     CreatePaymentSessionSerializer
 )
-from telegram_bot.models import UserProfile
-from telegram_bot.views import send_message
+from telegram_bot.outbox import queue_notification
 
 env = environ.Env()
 environ.Env.read_env()
@@ -25,8 +34,10 @@ SUCCESS_URL = f"https://{env('WEBHOOK_WITHOUT_PROTOCOL_AND_PATH')}/api/payments/
 CANCEL_URL = f"https://{env('WEBHOOK_WITHOUT_PROTOCOL_AND_PATH')}/api/payments/cancel-pay/?session_id="
 
 stripe.api_key = env("STRIPE_PRIVATE_KEY")
+stripe.api_base = settings.STRIPE_API_BASE
 
 class PaymentView(
+    ReplicaReadMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     GenericAPIView
@@ -37,8 +48,7 @@ class PaymentView(
     def get_queryset(self):
         queryset = Payment.objects.all()
         if not self.request.user.is_staff:
-            borrowings_ids = Borrowing.objects.filter(user=self.request.user.id).values_list("id", flat=True)
-            return queryset.filter(borrowing_id__in=borrowings_ids)
+            return queryset.filter(borrowing__user=self.request.user)
 
         if self.request.user.is_staff:
             return queryset
@@ -71,6 +81,8 @@ class PaymentView(
         operation_id="Get_Payments_List"
     )
     def get(self, request, *args, **kwargs):
+        if "pk" in kwargs:
+            return self.retrieve(request, *args, **kwargs)
         return self.list(request, *args, **kwargs)
 
     @extend_schema(
@@ -101,70 +113,90 @@ class PaymentView(
         operation_id="Get_Payment_By_ID"
     )
     def retrieve(self, request, *args, **kwargs):
-        return self.retrieve(request, *args, **kwargs)
+        return super().retrieve(request, *args, **kwargs)
 
 
-def create_checkout_session(borrowing_id: int):
-    borrowing_obj = Borrowing.objects.get(id=borrowing_id)
-    money_to_pay = (borrowing_obj.expected_return_date - borrowing_obj.borrow_date).days * borrowing_obj.book.daily_fee
-    amount_in_cents = int(money_to_pay * 100)
-
-    session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=[{
-            "price_data": {
-                "currency": "usd",
-                "product_data": {
-                    "name": borrowing_obj.book.title
+def borrowing_price(borrowing: Borrowing):
+    return (borrowing.expected_return_date - borrowing.borrow_date).days * borrowing.book.daily_fee
+
+
+def create_pending_payments(borrowings: list) -> list:
+    """
+    Record the payments for new borrowings and open one Stripe checkout
+    session for all of them in the background once the surrounding
+    transaction commits.
+    """
+    from payments.tasks import open_checkout_session_task
+
+    payments = Payment.objects.bulk_create([
+        Payment(type="PAYMENT", borrowing=borrowing, money_to_pay=borrowing_price(borrowing))
+        for borrowing in borrowings
+    ])
+    payment_ids = [payment.id for payment in payments]
+    transaction.on_commit(lambda: open_checkout_session_task.delay(payment_ids))
+    return payments
+
+
+def create_pending_payment(borrowing: Borrowing) -> Payment:
+    return create_pending_payments([borrowing])[0]
+
+
+def open_checkout_session(items: list) -> stripe.checkout.Session:
+    """
+    Open one Stripe checkout session with a line item per (payment, title)
+    pair and store it on every payment. Unsaved payments are only created
+    once Stripe has answered, so a failed call leaves no row behind.
+    """
+    with track_external("stripe"):
+        session = stripe.checkout.Session.create(
+            payment_method_types=["card"],
+            line_items=[{
+                "price_data": {
+                    "currency": "usd",
+                    "product_data": {
+                        "name": title
+                    },
+                    "unit_amount": int(payment.money_to_pay * 100),
                 },
-                "unit_amount": amount_in_cents,
-            },
-            "quantity": 1
-        }],
-        mode="payment",
-        success_url=SUCCESS_URL + "{CHECKOUT_SESSION_ID}",
-        cancel_url=CANCEL_URL + "{CHECKOUT_SESSION_ID}"
-    )
-    Payment.objects.create(
+                "quantity": 1
+            } for payment, title in items],
+            mode="payment",
+            success_url=SUCCESS_URL + "{CHECKOUT_SESSION_ID}",
+            cancel_url=CANCEL_URL + "{CHECKOUT_SESSION_ID}"
+        )
+    payments = [payment for payment, title in items]
+    for payment in payments:
+        payment.session_url = session.url
+        payment.session_id = session.id
+    saved = [payment for payment in payments if payment.pk is not None]
+    Payment.objects.bulk_create([payment for payment in payments if payment.pk is None])
+    Payment.objects.bulk_update(saved, ["session_url", "session_id"])
+    return session
+
+
+def create_checkout_session(borrowing_id: int):
+    borrowing_obj = Borrowing.objects.select_related("book").get(id=borrowing_id)
+    payment = Payment(
         type="PAYMENT",
-        borrowing_id=borrowing_id,
-        session_url=session.url,
-        session_id=session.id,
-        money_to_pay=money_to_pay
+        borrowing=borrowing_obj,
+        money_to_pay=borrowing_price(borrowing_obj)
     )
-    return session
+    return open_checkout_session([(payment, borrowing_obj.book.title)])
 
 
 def create_fine_checkout_session(borrowing_id: int, count_of_delay_days: int) -> stripe.checkout.Session:
-    borrowing_obj = Borrowing.objects.get(id=borrowing_id)
+    borrowing_obj = Borrowing.objects.select_related("book").get(id=borrowing_id)
     overdue_fine = (count_of_delay_days * borrowing_obj.book.daily_fee) * FINE_MULTIPLIER
-    overdue_fine_in_cents = int(overdue_fine * 100)
-
-    session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=[{
-            "price_data": {
-                "currency": "usd",
-                "product_data": {
-                    "name": f"Fine of overdue days for book: '{borrowing_obj.book.title}'\n "
-                            f"Count of overdue days: {count_of_delay_days}"
-                },
-                "unit_amount": overdue_fine_in_cents
-            },
-            "quantity": 1
-        }],
-        mode="payment",
-        success_url=SUCCESS_URL + "{CHECKOUT_SESSION_ID}",
-        cancel_url=CANCEL_URL + "{CHECKOUT_SESSION_ID}"
-    )
-    Payment.objects.create(
+    payment = Payment(
         type="FINE",
-        borrowing_id=borrowing_id,
-        session_url=session.url,
-        session_id=session.id,
+        borrowing=borrowing_obj,
         money_to_pay=overdue_fine
     )
-    return session
+    return open_checkout_session([(
+        payment,
+        f"Fine of overdue days for book: '{borrowing_obj.book.title}'\n "
+        f"Count of overdue days: {count_of_delay_days}"
+    )])
 
 
 class SuccessPayView(APIView):
@@ -200,22 +232,41 @@ class SuccessPayView(APIView):
         session_id = request.query_params.get("session_id")
 
         if session_id:
-            session = stripe.checkout.Session.retrieve(session_id)
-            payment = Payment.objects.get(session_id=session_id)
-            borrowing = Borrowing.objects.get(pk=payment.borrowing_id)
-            if session.payment_status == "paid":
-                payment.status = "PAID"
-                payment.save()
-                if not payment.type == "FINE":
-                    borrowing.pay_status = "PAID"
-                    borrowing.save()
-                user = get_user_model().objects.get(id=self.request.user.id)
-                try:
-                    user_profile = UserProfile.objects.get(email=user)
-                    send_message(chat_id=user_profile.telegram_chat_id,
-                                 text=f"You have successfully paid for the book: '{borrowing.book.title}'")
-                except UserProfile.DoesNotExist:
-                    pass
+            with track_external("stripe"):
+                session = stripe.checkout.Session.retrieve(session_id)
+            with transaction.atomic():
+                payments = list(
+                    Payment.objects
+                    .select_for_update(of=("self",))
+                    .select_related("borrowing__user", "borrowing__book")
+                    .filter(session_id=session_id)
+                )
+                if not payments:
+                    return Response(
+                        {"message": "Payment with given session id does not exist!"},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                borrowings = [payment.borrowing for payment in payments if payment.borrowing]
+                if session.payment_status == "paid":
+                    revenue = defaultdict(Decimal)
+                    for payment in payments:
+                        if payment.status not in PAID_STATUSES and payment.borrowing:
+                            revenue[payment.borrowing.book_id] += payment.money_to_pay
+                    Book.objects.add_revenue(revenue)
+                    Payment.objects.filter(session_id=session_id).exclude(status__in=PAID_STATUSES).update(
+                        status="PAID",
+                        paid_at=timezone.now()
+                    )
+                    Borrowing.objects.filter(
+                        pk__in=[payment.borrowing_id for payment in payments if not payment.type == "FINE"]
+                    ).update(pay_status="PAID", updated_at=timezone.now())
+                    invalidate_borrowings([borrowing.user_id for borrowing in borrowings])
+                    if borrowings:
+                        titles = ", ".join(f"'{borrowing.book.title}'" for borrowing in borrowings)
+                        queue_notification(
+                            email=borrowings[0].user.email,
+                            text=f"You have successfully paid for the book{'s' if len(borrowings) > 1 else ''}: {titles}"
+                        )
 
             return Response({
                 "message": "Payment was successful!",
@@ -230,6 +281,7 @@ class SuccessPayView(APIView):
 
 class CancelPayView(APIView):
     serializer_class = PaymentSerializer
+    permission_classes = [IsAuthenticated, ]
 
     @extend_schema(
         summary="Get a cancel page",
@@ -237,27 +289,58 @@ class CancelPayView(APIView):
         tags=["payment"],
         responses={
             200: OpenApiResponse(description="message: Your order was canceled. Please try again"),
+            400: OpenApiResponse(description="The session ID is missing or matches none of your payments"),
         },
         operation_id="Cancel_Payment"
     )
     def get(self, request, *args, **kwargs):
-        user = get_user_model().objects.get(pk=self.request.user.pk)
         session_id = self.request.query_params.get("session_id")
-        try:
-            canceled_pay = Payment.objects.get(session_id=str(session_id))
-        except Payment.DoesNotExist:
+        if not session_id:
+            # Pending payments have no session yet; an empty id must not match them.
+            return Response({"error": "Session ID is missing"}, status=status.HTTP_400_BAD_REQUEST)
+        canceled_pays = list(
+            Payment.objects
+            .select_related("borrowing__user")
+            .filter(session_id=session_id, borrowing__user=request.user)
+        )
+        if not canceled_pays:
             return Response(
                 {"message": "Payment with given session id does not exist!"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        borrowing = Borrowing.objects.get(pk=canceled_pay.borrowing_id)
-        canceled_pay.delete()
-        borrowing.delete()
-        try:
-            user_profile = UserProfile.objects.get(email=user)
-            send_message(chat_id=user_profile.telegram_chat_id, text="You canceled the payment. Please try again...")
-        except UserProfile.DoesNotExist:
-            pass
+        with transaction.atomic():
+            borrowings = [payment.borrowing for payment in canceled_pays if payment.borrowing]
+            # The deleted borrowings take their paid payments out of the
+            # book counters with them, so the counters must follow.
+            paid = (
+                Payment.objects
+                .filter(borrowing__in=borrowings, status__in=PAID_STATUSES)
+                .values("borrowing__book")
+                .annotate(total=Sum("money_to_pay"))
+                .order_by()
+            )
+            Book.objects.add_revenue({row["borrowing__book"]: -row["total"] for row in paid})
+            Payment.objects.filter(pk__in=[payment.pk for payment in canceled_pays]).delete()
+            Borrowing.objects.filter(pk__in=[borrowing.pk for borrowing in borrowings]).delete()
+            now = timezone.now()
+            open_borrowings = [borrowing for borrowing in borrowings if borrowing.actual_return_date is None]
+            for overdue in (False, True):
+                Book.objects.release_many(
+                    [
+                        borrowing.book_id for borrowing in open_borrowings
+                        if (borrowing.expected_return_date <= now) == overdue
+                    ],
+                    cancelled=True,
+                    overdue=overdue
+                )
+            Book.objects.forget_returned_loans(
+                [borrowing.book_id for borrowing in borrowings if borrowing.actual_return_date is not None]
+            )
+            if borrowings:
+                queue_notification(
+                    email=borrowings[0].user.email,
+                    text="You canceled the payment. Please try again..."
+                )
         return Response({"message": "Your order was canceled. Please try again"}, status=status.HTTP_200_OK)
 
 
@@ -309,5 +392,5 @@ class CreateCheckoutSessionView(APIView):
 
             checkout_session = create_checkout_session(borrowing_id)
 
-            return Response({"checkout_url": checkout_session.session.url}, status=status.HTTP_200_OK)
+            return Response({"checkout_url": checkout_session.url}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -1,3 +1,6 @@
 from django.contrib import admin
 
-# Register your models here.
+from telegram_bot.models import Notification
+
+
+admin.site.register(Notification)
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="UserProfile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("telegram_chat_id", models.CharField(max_length=255)),
+                ("email", models.EmailField(max_length=254, unique=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("telegram_bot", "0002_notification"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                condition=models.Q(("status", "Pending")),
+                fields=["id"],
+                name="notification_pending_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="userprofile",
+            index=models.Index(
+                fields=["telegram_chat_id"], name="userprofile_chat_id_idx"
+            ),
+        ),
+    ]
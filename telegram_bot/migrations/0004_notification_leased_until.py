@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("telegram_bot", "0003_hot_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="leased_until",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
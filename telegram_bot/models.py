@@ -4,5 +4,38 @@ class UserProfile(models.Model):
     telegram_chat_id = models.CharField(max_length=255)
     email = models.EmailField(unique=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["telegram_chat_id"], name="userprofile_chat_id_idx"),
+        ]
+
     def __str__(self):
         return self.email
+
+
+class Notification(models.Model):
+    class StatusChoices(models.TextChoices):
+        PENDING = "Pending"
+        SENT = "Sent"
+        SKIPPED = "Skipped"
+        FAILED = "Failed"
+
+    email = models.EmailField()
+    text = models.TextField()
+    status = models.CharField(max_length=55, choices=StatusChoices, default=StatusChoices.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    leased_until = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=models.Q(status="Pending"),
+                name="notification_pending_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.email}: {self.status}"
@@ -0,0 +1,17 @@
+from django.db import transaction
+
+from telegram_bot.models import Notification
+
+
+def queue_notification(email: str, text: str) -> Notification:
+    """
+    Record a Telegram message in the outbox as part of the caller's
+    transaction; it is delivered by a Celery consumer once that commits.
+    If the broker is down the caller's commit still stands, and the
+    minutely beat sweep delivers the row instead.
+    """
+    from telegram_bot.tasks import deliver_notifications
+
+    notification = Notification.objects.create(email=email, text=text)
+    transaction.on_commit(deliver_notifications.delay, robust=True)
+    return notification
@@ -0,0 +1,189 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from library_service.metrics import track_external
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursting up to `capacity`.
+    """
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class SharedRateLimiter:
+    """
+    A rate limit shared by every process that uses the same cache: sends are
+    counted per time window under one cache key, so N workers together stay
+    at `rate` per second. Windows are short (at most 1/5 s), so the burst at
+    a window boundary stays small. `pause` stops every process until the
+    given number of seconds has passed.
+    """
+    def __init__(self, rate: float, prefix: str, clock=time.time, sleep=time.sleep):
+        self.window = max(0.2, 1 / rate)
+        self.allowance = max(1, int(rate * self.window))
+        self.prefix = prefix
+        self.clock = clock
+        self.sleep = sleep
+
+    def acquire(self) -> None:
+        while True:
+            now = self.clock()
+            paused_until = cache.get(f"{self.prefix}:paused_until")
+            if paused_until is not None and paused_until > now:
+                self.sleep(paused_until - now)
+                continue
+
+            slot = int(now / self.window)
+            key = f"{self.prefix}:{slot}"
+            cache.add(key, 0, timeout=math.ceil(self.window) + 1)
+            try:
+                if cache.incr(key) <= self.allowance:
+                    return
+            except ValueError:
+                # The window expired between add and incr; take the next one.
+                continue
+            self.sleep((slot + 1) * self.window - now)
+
+    def pause(self, seconds: float) -> None:
+        until = self.clock() + seconds
+        paused_until = cache.get(f"{self.prefix}:paused_until")
+        if paused_until is None or until > paused_until:
+            cache.set(f"{self.prefix}:paused_until", until, timeout=math.ceil(seconds) + 1)
+
+
+class TelegramSender:
+    """
+    Sends Bot API messages over one keep-alive connection pool while keeping
+    under Telegram's global and per-chat limits and honouring `retry_after`.
+    The global limit and 429 pauses are shared through the cache, so they
+    hold across workers when the cache is Redis; per-chat buckets are kept
+    in process for the `chat_bucket_limit` most recently used chats.
+    """
+    def __init__(
+        self,
+        token: str,
+        api_base: str = "https://api.telegram.org",
+        global_rate: float = 30,
+        per_chat_rate: float = 1,
+        timeout: float = 10,
+        max_retries: int = 3,
+        pool_size: int = 8,
+        chat_bucket_limit: int = 10000,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        self.url = f"{api_base}/bot{token}/sendMessage"
+        self.per_chat_rate = per_chat_rate
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.chat_bucket_limit = chat_bucket_limit
+        self.clock = clock
+        self.sleep = sleep
+
+        self.session = requests.Session()
+        self.session.mount(api_base, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+        self.global_limiter = SharedRateLimiter(global_rate, "telegram:rate", clock=clock, sleep=sleep)
+        self.chat_buckets = OrderedDict()
+        self.chat_buckets_lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        with self.chat_buckets_lock:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(
+                    self.per_chat_rate, 1, clock=self.clock, sleep=self.sleep
+                )
+                if len(self.chat_buckets) > self.chat_bucket_limit:
+                    self.chat_buckets.popitem(last=False)
+            else:
+                self.chat_buckets.move_to_end(chat_id)
+            return bucket
+
+    def send(self, chat_id, text: str) -> dict:
+        payload = {"chat_id": chat_id, "text": text}
+        chat_bucket = self._chat_bucket(chat_id)
+
+        for attempt in range(self.max_retries + 1):
+            chat_bucket.acquire()
+            self.global_limiter.acquire()
+            with track_external("telegram"):
+                response = self.session.post(self.url, data=payload, timeout=self.timeout)
+
+            if response.status_code == 429 and attempt < self.max_retries:
+                # Telegram throttles the whole bot, so every sender waits.
+                retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+                self.global_limiter.pause(retry_after)
+                continue
+
+            response.raise_for_status()
+            return response.json()
+
+    def send_each(self, messages: Iterable[tuple]) -> list:
+        """
+        Send (chat_id, text) pairs concurrently over the pool and return
+        whether each one was delivered, in input order.
+        """
+        def deliver(message):
+            try:
+                self.send(*message)
+                return True
+            except requests.RequestException:
+                return False
+
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            return list(executor.map(deliver, messages))
+
+    def send_many(self, messages: Iterable[tuple]) -> dict:
+        results = self.send_each(messages)
+        return {"sent": results.count(True), "failed": results.count(False)}
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender() -> TelegramSender:
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = TelegramSender(
+                token=settings.BOT_TOKEN,
+                api_base=settings.TELEGRAM_API_BASE,
+                global_rate=settings.TELEGRAM_GLOBAL_RATE_LIMIT,
+                per_chat_rate=settings.TELEGRAM_PER_CHAT_RATE_LIMIT,
+                timeout=settings.TELEGRAM_TIMEOUT,
+                max_retries=settings.TELEGRAM_MAX_RETRIES,
+                pool_size=settings.TELEGRAM_POOL_SIZE,
+            )
+        return _sender
@@ -1,36 +1,205 @@
-from celery import shared_task
-from celery.utils.time import timezone
-from django.contrib.auth import get_user_model
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, QuerySet
+from django.utils import timezone
 
 from borrowings.models import Borrowing
-from telegram_bot.models import UserProfile
-from telegram_bot.views import send_message
+from telegram_bot.models import Notification, UserProfile
+from telegram_bot.sender import get_sender
+
+
+NO_OVERDUE_TEXT = "No borrowings overdue today!"
+
+
+def build_overdue_digest(overdue_books: list) -> str:
+    text = "You had to return books:\n"
+    for title, author, expected_return_date in overdue_books:
+        text += \
+            f"Title: {title} \n" \
+            f"Author: {author} \n" \
+            f"To: {expected_return_date}\n"
+    return text + "Please, return the books as soon as possible!\n"
+
+
+def overdue_borrowings(cutoff: datetime) -> QuerySet:
+    return Borrowing.objects.filter(actual_return_date__isnull=True, expected_return_date__lte=cutoff)
+
+
+def iter_id_ranges(queryset: QuerySet, field: str, chunk_size: int):
+    """
+    Walk distinct values of `field` with keyset pagination and yield
+    inclusive (first, last) bounds of at most `chunk_size` values each.
+    """
+    last_id = 0
+    while True:
+        ids = list(
+            queryset
+            .filter(**{f"{field}__gt": last_id})
+            .order_by(field)
+            .values_list(field, flat=True)
+            .distinct()[:chunk_size]
+        )
+        if not ids:
+            return
+        yield ids[0], ids[-1]
+        last_id = ids[-1]
 
 
 @shared_task
-def every_day_notification():
-    user_profiles = UserProfile.objects.all()
-    borrowings = Borrowing.objects.filter(actual_return_date__isnull=True).filter(expected_return_date__lte=timezone.now())
-
-    users_list = []
-    for borrowing in borrowings:
-        user_profile = user_profiles.get(email=borrowing.user.email)
-        book = borrowing.book
-        data = \
-            "You had to return book: \n " \
-            f"Title: {book.title} \n" \
-            f"Author: {book.author} \n" \
-            f"To: {borrowing.expected_return_date}\n" \
-            "Please, return the book as soon as possible!\n"
-        users_list.append(int(borrowing.user.id))
-
-        send_message(user_profile.telegram_chat_id, text=data)
-
-    users_without_borrowings = get_user_model().objects.filter(id__in=users_list)
-    for user in users_without_borrowings:
-        if user.id not in users_list:
-            user_profile = user_profiles.get(email=user.email)
-            send_message(
-                chat_id=user_profile.telegram_chat_id,
-                text="No borrowings overdue today!"
-            )
+def send_overdue_digests(first_user_id: int, last_user_id: int, cutoff: str) -> dict:
+    overdue = (
+        overdue_borrowings(datetime.fromisoformat(cutoff))
+        .filter(user_id__gte=first_user_id, user_id__lte=last_user_id)
+        .order_by("user_id", "expected_return_date")
+        .values_list("user__email", "book__title", "book__author", "expected_return_date")
+    )
+
+    overdue_by_email = defaultdict(list)
+    for email, title, author, expected_return_date in overdue:
+        overdue_by_email[email].append((title, author, expected_return_date))
+
+    chat_ids = dict(
+        UserProfile.objects
+        .filter(email__in=overdue_by_email.keys())
+        .values_list("email", "telegram_chat_id")
+    )
+
+    messages = [
+        (chat_ids[email], build_overdue_digest(overdue_books))
+        for email, overdue_books in overdue_by_email.items()
+        if email in chat_ids
+    ]
+    return {
+        **get_sender().send_many(messages),
+        "skipped": len(overdue_by_email) - len(messages),
+    }
+
+
+@shared_task
+def send_no_overdue_notices(first_profile_id: int, last_profile_id: int, cutoff: str) -> dict:
+    overdue_emails = overdue_borrowings(datetime.fromisoformat(cutoff)).values("user__email")
+    chat_ids = (
+        UserProfile.objects
+        .filter(id__range=(first_profile_id, last_profile_id))
+        .exclude(email__in=overdue_emails)
+        .values_list("telegram_chat_id", flat=True)
+    )
+
+    return {
+        **get_sender().send_many((chat_id, NO_OVERDUE_TEXT) for chat_id in chat_ids),
+        "skipped": 0,
+    }
+
+
+@shared_task
+def summarize_notifications(results: list) -> dict:
+    summary = {"chunks": len(results), "sent": 0, "skipped": 0, "failed": 0}
+    for counts in results:
+        for key in ("sent", "skipped", "failed"):
+            summary[key] += counts[key]
+    return summary
+
+
+@shared_task
+def every_day_notification() -> dict:
+    """
+    Split the daily sweep into bounded chunks and fan them out as a chord,
+    so every worker takes a share and a failed chunk can be rerun alone.
+    The totals are reported by summarize_notifications once all chunks end.
+    """
+    cutoff = timezone.now()
+    chunk_size = settings.OVERDUE_NOTIFICATION_CHUNK_SIZE
+
+    header = [
+        send_overdue_digests.s(first_id, last_id, cutoff.isoformat())
+        for first_id, last_id in iter_id_ranges(overdue_borrowings(cutoff), "user_id", chunk_size)
+    ]
+    header += [
+        send_no_overdue_notices.s(first_id, last_id, cutoff.isoformat())
+        for first_id, last_id in iter_id_ranges(UserProfile.objects.all(), "id", chunk_size)
+    ]
+
+    if not header:
+        return {"chunks": 0, "chord_id": None}
+    return {"chunks": len(header), "chord_id": chord(header)(summarize_notifications.s()).id}
+
+
+def claim_notifications(last_id: int, now: datetime) -> list:
+    """
+    Lease the next batch of pending rows to this consumer and commit, so the
+    row locks last only as long as the claim. A consumer that dies leaves
+    its lease to expire, and the rows are claimed again after that.
+    """
+    with transaction.atomic():
+        batch = list(
+            Notification.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=Notification.StatusChoices.PENDING, id__gt=last_id)
+            .filter(Q(leased_until__isnull=True) | Q(leased_until__lt=now))
+            .order_by("id")[:settings.NOTIFICATION_OUTBOX_BATCH_SIZE]
+        )
+        leased_until = now + timedelta(seconds=settings.NOTIFICATION_LEASE_SECONDS)
+        Notification.objects.filter(id__in=[notification.id for notification in batch]).update(
+            leased_until=leased_until
+        )
+    for notification in batch:
+        notification.leased_until = leased_until
+    return batch
+
+
+def record_deliveries(batch: list, sent: list, skipped: list, failed: list) -> None:
+    """
+    Store the outcome of a claimed batch in one short transaction. Rows whose
+    lease was taken over by another consumer meanwhile are left to it.
+    """
+    leased = Notification.objects.filter(leased_until=batch[0].leased_until)
+    with transaction.atomic():
+        leased.filter(id__in=sent).update(
+            status=Notification.StatusChoices.SENT, sent_at=timezone.now(),
+            attempts=F("attempts") + 1, leased_until=None
+        )
+        leased.filter(id__in=skipped).update(status=Notification.StatusChoices.SKIPPED, leased_until=None)
+        leased.filter(id__in=failed, attempts__gte=settings.NOTIFICATION_MAX_ATTEMPTS - 1).update(
+            status=Notification.StatusChoices.FAILED, attempts=F("attempts") + 1, leased_until=None
+        )
+        leased.filter(id__in=failed).update(attempts=F("attempts") + 1, leased_until=None)
+
+
+@shared_task
+def deliver_notifications() -> dict:
+    """
+    Drain pending outbox rows in batches. Each batch is claimed with a lease
+    under SKIP LOCKED, sent outside any transaction and then marked, so
+    several consumers can drain the outbox at once without double sends.
+    """
+    counts = {"sent": 0, "skipped": 0, "failed": 0}
+    last_id = 0
+
+    while True:
+        batch = claim_notifications(last_id, timezone.now())
+        if not batch:
+            return counts
+        last_id = batch[-1].id
+
+        chat_ids = dict(
+            UserProfile.objects
+            .filter(email__in={notification.email for notification in batch})
+            .values_list("email", "telegram_chat_id")
+        )
+        deliverable = [notification for notification in batch if notification.email in chat_ids]
+        results = get_sender().send_each(
+            (chat_ids[notification.email], notification.text) for notification in deliverable
+        )
+
+        sent = [notification.id for notification, delivered in zip(deliverable, results) if delivered]
+        failed = [notification.id for notification, delivered in zip(deliverable, results) if not delivered]
+        skipped = [notification.id for notification in batch if notification.email not in chat_ids]
+        record_deliveries(batch, sent, skipped, failed)
+
+        counts["sent"] += len(sent)
+        counts["skipped"] += len(skipped)
+        counts["failed"] += len(failed)
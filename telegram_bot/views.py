@@ -2,20 +2,23 @@ from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from django.views import View
 import json
+import logging
 import requests
-from environ import environ
 
 from telegram_bot.models import UserProfile
+from telegram_bot.sender import get_sender
 
 
-env = environ.Env()
-environ.Env.read_env()
+logger = logging.getLogger(__name__)
 
 
-def send_message(chat_id, text):
-    url = f"https://api.telegram.org/bot{env('BOT_TOKEN')}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text}
-    requests.post(url, data=payload)
+def send_message(chat_id, text) -> bool:
+    try:
+        get_sender().send(chat_id, text)
+        return True
+    except requests.RequestException:
+        logger.exception("Failed to send Telegram message to chat %s", chat_id)
+        return False
 
 
 class TelegramWebhookView(View):
@@ -36,13 +39,13 @@ class TelegramWebhookView(View):
         return JsonResponse({"status": "ok"})
 
     def check_email_and_respond(self, chat_id, email):
-        user_profile_emails = UserProfile.objects.values_list("email", flat=True)
-        user_profile_ids = UserProfile.objects.values_list("telegram_chat_id", flat=True)
-        if email not in user_profile_emails and chat_id not in user_profile_ids:
+        email_is_linked = UserProfile.objects.filter(email=email).exists()
+        chat_is_linked = UserProfile.objects.filter(telegram_chat_id=chat_id).exists()
+        if not email_is_linked and not chat_is_linked:
             UserProfile.objects.create(telegram_chat_id=chat_id, email=email)
             send_message(chat_id, "You were successfully logged in!")
 
-        elif email in user_profile_emails or chat_id in user_profile_ids:
+        elif email_is_linked or chat_is_linked:
             UserProfile.objects.get(telegram_chat_id=chat_id)
             send_message(chat_id, "You were successfully logged in!")
         else:
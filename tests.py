@@ -1,8 +1,25 @@
-from datetime import datetime
-
+import itertools
+import json
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+import stripe
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
 from django.utils import timezone
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -11,12 +28,34 @@ from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
 
 
+from analytics.models import DailyBookStats, DailyCohortStats, DailyTotals
+from analytics.rollups import build_rollups
+from analytics.tasks import build_daily_rollups
+from books.counters import refresh_overdue_counters, reconcile_counters
 from books.models import Book
 from books.serializers import BookSerializer
+from library_service.db_router import ReplicaRouter, RoutingState, pin_key, routing_state
+from library_service.metrics import sample_value, track_external
+from library_service.pagination import IdCursorPagination
 from borrowings.models import Borrowing
 from borrowings.serializers import BorrowingSerializer
 from payments.models import Payment
 from payments.serializers import PaymentSerializer
+from payments.tasks import open_checkout_session_task
+from payments.views import create_checkout_session, create_fine_checkout_session
+from telegram_bot.models import Notification, UserProfile
+from telegram_bot.outbox import queue_notification
+from telegram_bot.sender import SharedRateLimiter, TelegramSender, TokenBucket
+from telegram_bot.tasks import (
+    claim_notifications,
+    deliver_notifications,
+    every_day_notification,
+    overdue_borrowings,
+    send_no_overdue_notices,
+    send_overdue_digests,
+    summarize_notifications,
+    NO_OVERDUE_TEXT
+)
 
 
 class BaseCase(TestCase):
@@ -53,18 +92,18 @@ class BaseCase(TestCase):
             pay_status="PAID",
             book=self.book,
             user=self.user
-        ),
+        )
         self.borrowing1 = Borrowing.objects.create(
             borrow_date=timezone.make_aware(datetime(2030, 10, 10, 10, 10, 10)),
             expected_return_date=timezone.make_aware(datetime(2030, 10, 11, 10, 10, 10)),
             pay_status="PAID",
             book=self.book1,
             user=self.superuser
-        ),
+        )
         self.payment = Payment.objects.create(
             status="PAID",
             type="PAYMENT",
-            borrowing_id=1,
+            borrowing_id=self.borrowing.id,
             session_url="https://fake.com",
             session_id="fake_id_777777779999999900000",
             money_to_pay=19.99
@@ -72,7 +111,7 @@ class BaseCase(TestCase):
         self.payment1 = Payment.objects.create(
             status="PAID",
             type="FINE",
-            borrowing_id=2,
+            borrowing_id=self.borrowing1.id,
             session_url="https://fake.com",
             session_id="fake_id_777723423479999999900000",
             money_to_pay=29.99
@@ -89,7 +128,7 @@ class BookApiTests(BaseCase):
     def setUp(self):
         super().setUp()
         self.list_url = reverse("books:book-list")
-        self.detail_url = reverse("books:book-detail", kwargs={"pk": 1})
+        self.detail_url = reverse("books:book-detail", kwargs={"pk": self.book.pk})
 
     def test_if_list_returns_all_books_and_contains_the_right_data(self):
         response = self.client.get(self.list_url)
@@ -97,7 +136,7 @@ class BookApiTests(BaseCase):
         books = Book.objects.all()
         serializer = BookSerializer(books, many=True)
 
-        self.assertEqual(serializer.data, response.data)
+        self.assertEqual(serializer.data, response.data["results"])
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertContains(response, self.book.title)
         self.assertContains(response, self.book1.title)
@@ -182,7 +221,7 @@ class BorrowingsApiTests(BaseCase):
             "pay_status": "PAID",
             "book": self.book.id
         }
-        self.detail_url = reverse("borrowings:borrowing-detail", kwargs={"pk": 1})
+        self.detail_url = reverse("borrowings:borrowing-detail", kwargs={"pk": self.borrowing.pk})
 
     def test_if_user_gets_only_his_borrowings_and_contains_his_borrowing_status_200(self):
         response = self.client.get(self.list_url)
@@ -193,7 +232,7 @@ class BorrowingsApiTests(BaseCase):
         borrowing1 = Borrowing.objects.get(user=self.superuser.id)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(serializer.data, response.data)
+        self.assertEqual(serializer.data, response.data["results"])
         self.assertContains(response, borrowing.expected_return_date.isoformat().replace("+00:00", "Z"))
         self.assertContains(response, borrowing.borrow_date.isoformat().replace("+00:00", "Z"))
         self.assertNotContains(response, borrowing1.expected_return_date.isoformat().replace("+00:00", "Z"))
@@ -215,6 +254,39 @@ class BorrowingsApiTests(BaseCase):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    @mock.patch("telegram_bot.tasks.deliver_notifications.delay")
+    @mock.patch("payments.tasks.open_checkout_session_task.delay")
+    def test_create_borrowing_returns_pending_payment_and_opens_session_after_commit(self, delay, _):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.list_url, data=self.borrowing_data, format="json")
+
+        payment = Payment.objects.get(id=response.data["payment_id"])
+        self.assertIsNone(response.data["checkout_session"])
+        self.assertEqual(payment.borrowing_id, response.data["id"])
+        self.assertEqual(payment.session_url, "")
+        delay.assert_called_once_with([payment.id])
+
+    @mock.patch("payments.views.stripe.checkout.Session.create")
+    def test_checkout_session_task_stores_session_url(self, session_create):
+        session_create.return_value = mock.Mock(id="cs_test_1", url="https://checkout.test/cs_test_1")
+        borrowing = Borrowing.objects.get(user=self.user)
+        payment = Payment.objects.create(type="PAYMENT", borrowing_id=borrowing.id, money_to_pay=1)
+
+        open_checkout_session_task([payment.id])
+        open_checkout_session_task([payment.id])
+
+        payment.refresh_from_db()
+        session_create.assert_called_once()
+        self.assertEqual(payment.session_id, "cs_test_1")
+        self.assertEqual(payment.session_url, "https://checkout.test/cs_test_1")
+
+    @mock.patch("payments.views.stripe.checkout.Session.create")
+    def test_checkout_session_task_skips_payments_of_deleted_borrowings(self, session_create):
+        payment = Payment.objects.create(type="PAYMENT", borrowing=None, money_to_pay=1)
+
+        self.assertEqual(open_checkout_session_task([payment.id]), "")
+        session_create.assert_not_called()
+
     def test_if_anonymous_user_enters_status_401(self):
         self.client.logout()
         response = self.client.get(self.list_url)
@@ -232,6 +304,15 @@ class BorrowingsApiTests(BaseCase):
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_create_borrowing_when_book_is_out_of_stock_status_400(self):
+        Book.objects.filter(pk=self.book.pk).update(inventory=0)
+        borrowings_count = Borrowing.objects.count()
+
+        response = self.client.post(self.list_url, data=self.borrowing_data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Borrowing.objects.count(), borrowings_count)
+
     def test_create_borrowing_without_data_status_400(self):
         data = {
             "borrow_date": "",
@@ -250,7 +331,7 @@ class BorrowingsApiTests(BaseCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
     def test_return_book_is_staff_false_status_403(self):
-        return_url = reverse("borrowings:return-book", kwargs={"pk": 2})
+        return_url = reverse("borrowings:return-book", kwargs={"pk": self.borrowing1.pk})
         response = self.client.post(return_url)
 
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -258,7 +339,7 @@ class BorrowingsApiTests(BaseCase):
 
     def test_return_book_if_is_staff_true_status_200(self):
         self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.super_access)
-        return_url = reverse("borrowings:return-book", kwargs={"pk": 2})
+        return_url = reverse("borrowings:return-book", kwargs={"pk": self.borrowing1.pk})
         response = self.client.post(return_url, data={}, format="json")
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -276,7 +357,7 @@ class PaymentApiTest(BaseCase):
     def setUp(self):
         super().setUp()
         self.list_url = reverse("payments:payment_list")
-        self.detail_url = reverse("payments:payment_detail", kwargs={"pk": 1})
+        self.detail_url = reverse("payments:payment_detail", kwargs={"pk": self.payment.pk})
 
     def test_if_user_gets_only_his_payments_and_contains_his_payments_status_200(self):
         response = self.client.get(self.list_url)
@@ -285,11 +366,11 @@ class PaymentApiTest(BaseCase):
         users_payments = Payment.objects.filter(borrowing_id__in=user_borrowings)
         serializer = PaymentSerializer(users_payments, many=True)
 
-        payment = Payment.objects.get(id=1)
-        payment1 = Payment.objects.get(id=2)
+        payment = Payment.objects.get(id=self.payment.id)
+        payment1 = Payment.objects.get(id=self.payment1.id)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(serializer.data, response.data)
+        self.assertEqual(serializer.data, response.data["results"])
         self.assertContains(response, payment.type)
         self.assertContains(response, payment.status)
         self.assertNotContains(response, payment1.type)
@@ -319,12 +400,1376 @@ class PaymentApiTest(BaseCase):
 
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
 
+    def test_user_payment_list_joins_borrowings_instead_of_subquery(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.list_url)
+
+        payment_query = queries.captured_queries[-1]["sql"]
+        self.assertIn('INNER JOIN "borrowings_borrowing"', payment_query)
+        self.assertNotIn("IN (SELECT", payment_query)
+
+    @mock.patch("telegram_bot.tasks.deliver_notifications.delay")
+    def test_cancel_callback_deletes_borrowing_and_restores_inventory(self, _):
+        borrowing = Borrowing.objects.get(user=self.user)
+        borrowing.actual_return_date = None
+        borrowing.save()
+        Payment.objects.create(type="PAYMENT", borrowing=borrowing, session_id="cs_cancel", money_to_pay=1)
+
+        response = self.client.get(reverse("payments:cancel-pay"), {"session_id": "cs_cancel"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Borrowing.objects.filter(pk=borrowing.pk).exists())
+        self.assertFalse(Payment.objects.filter(session_id="cs_cancel").exists())
+        self.assertEqual(Book.objects.get(pk=borrowing.book_id).inventory, 4)
+        self.assertIsNone(Payment.objects.get(pk=self.payment.pk).borrowing_id)
+
+    @mock.patch("telegram_bot.tasks.deliver_notifications.delay")
+    def test_cancel_without_session_id_leaves_pending_payments_alone(self, _):
+        Payment.objects.create(type="PAYMENT", borrowing=self.borrowing, money_to_pay=1)
+        Payment.objects.create(type="PAYMENT", borrowing=self.borrowing1, money_to_pay=1)
+
+        responses = [
+            self.client.get(reverse("payments:cancel-pay"), {"session_id": ""}),
+            self.client.get(reverse("payments:cancel-pay")),
+        ]
+        self.client.credentials()
+        anonymous = self.client.get(reverse("payments:cancel-pay"), {"session_id": ""})
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_400_BAD_REQUEST] * 2)
+        self.assertEqual(anonymous.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(Payment.objects.filter(session_id="").count(), 2)
+        self.assertEqual(Borrowing.objects.count(), 2)
+
+    @mock.patch("telegram_bot.tasks.deliver_notifications.delay")
+    def test_cancel_does_not_touch_other_users_payments(self, _):
+        Payment.objects.create(type="PAYMENT", borrowing=self.borrowing1, session_id="cs_other", money_to_pay=1)
+
+        response = self.client.get(reverse("payments:cancel-pay"), {"session_id": "cs_other"})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(Payment.objects.filter(session_id="cs_other").exists())
+        self.assertTrue(Borrowing.objects.filter(pk=self.borrowing1.pk).exists())
+
+    @mock.patch("stripe.checkout.Session.create", side_effect=stripe.APIConnectionError("down"))
+    def test_failed_stripe_call_leaves_no_payment_behind(self, _):
+        payments = Payment.objects.count()
+
+        with self.assertRaises(stripe.APIConnectionError):
+            create_fine_checkout_session(self.borrowing.id, count_of_delay_days=3)
+        with self.assertRaises(stripe.APIConnectionError):
+            create_checkout_session(self.borrowing.id)
+
+        self.assertEqual(Payment.objects.count(), payments)
+
     def test_retrieve_status_200(self):
         response = self.client.get(self.detail_url)
 
-        payment = Payment.objects.filter(id=1)
-        serializer = PaymentSerializer(payment, many=True)
+        payment = Payment.objects.get(id=self.payment.id)
+        serializer = PaymentSerializer(payment)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(serializer.data, response.data)
         self.assertNotContains(response, self.payment1.type)
+
+
+class FakeSender:
+    def __init__(self, undeliverable=()):
+        self.messages = []
+        self.undeliverable = undeliverable
+
+    def send_each(self, messages):
+        messages = list(messages)
+        self.messages.extend(messages)
+        return [chat_id not in self.undeliverable for chat_id, text in messages]
+
+    def send_many(self, messages):
+        messages = list(messages)
+        self.messages.extend(messages)
+        return {"sent": len(messages), "failed": 0}
+
+
+class EveryDayNotificationTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        UserProfile.objects.create(email=self.user.email, telegram_chat_id="111")
+        UserProfile.objects.create(email=self.superuser.email, telegram_chat_id="222")
+        self.cutoff = timezone.now().isoformat()
+        self.sender = FakeSender()
+        patcher = mock.patch("telegram_bot.tasks.get_sender", return_value=self.sender)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_overdue_users_get_one_digest(self):
+        Borrowing.objects.create(
+            borrow_date=timezone.make_aware(datetime(2025, 10, 10, 10, 10, 10)),
+            expected_return_date=timezone.make_aware(datetime(2025, 10, 12, 10, 10, 10)),
+            book=self.book1,
+            user=self.user
+        )
+
+        result = send_overdue_digests(self.user.id, self.user.id, self.cutoff)
+
+        self.assertEqual(len(self.sender.messages), 1)
+        chat_id, text = self.sender.messages[0]
+        self.assertEqual(chat_id, "111")
+        self.assertIn(self.book.title, text)
+        self.assertIn(self.book1.title, text)
+        self.assertEqual(result, {"sent": 1, "skipped": 0, "failed": 0})
+
+    def test_users_without_overdue_get_no_overdue_message(self):
+        first_id, last_id = UserProfile.objects.order_by("id").values_list("id", flat=True)
+
+        result = send_no_overdue_notices(first_id, last_id, self.cutoff)
+
+        self.assertEqual(self.sender.messages, [("222", NO_OVERDUE_TEXT)])
+        self.assertEqual(result, {"sent": 1, "skipped": 0, "failed": 0})
+
+    def test_overdue_users_without_profile_are_skipped(self):
+        UserProfile.objects.filter(email=self.user.email).delete()
+
+        result = send_overdue_digests(self.user.id, self.user.id, self.cutoff)
+
+        self.assertEqual(self.sender.messages, [])
+        self.assertEqual(result, {"sent": 0, "skipped": 1, "failed": 0})
+
+    def test_chunk_query_count_does_not_grow_with_overdue_borrowings(self):
+        for _ in range(20):
+            Borrowing.objects.create(
+                expected_return_date=timezone.make_aware(datetime(2025, 10, 12, 10, 10, 10)),
+                book=self.book1,
+                user=self.user
+            )
+
+        with self.assertNumQueries(2):
+            send_overdue_digests(self.user.id, self.superuser.id, self.cutoff)
+
+    @mock.patch("telegram_bot.tasks.chord")
+    def test_coordinator_dispatches_one_chunk_per_range(self, chord):
+        extra_users = [
+            get_user_model().objects.create_user(email=f"reader{i}@test.com", password="1qazcde3")
+            for i in range(3)
+        ]
+        for user in extra_users:
+            Borrowing.objects.create(
+                expected_return_date=timezone.make_aware(datetime(2025, 10, 12, 10, 10, 10)),
+                book=self.book,
+                user=user
+            )
+
+        with self.settings(OVERDUE_NOTIFICATION_CHUNK_SIZE=2):
+            result = every_day_notification()
+
+        header = chord.call_args.args[0]
+        self.assertEqual(result, {"chunks": len(header), "chord_id": chord.return_value.return_value.id})
+        digest_ranges = [s.args[:2] for s in header if s.task.endswith("send_overdue_digests")]
+        notice_ranges = [s.args[:2] for s in header if s.task.endswith("send_no_overdue_notices")]
+        self.assertEqual(digest_ranges, [(self.user.id, extra_users[0].id), (extra_users[1].id, extra_users[2].id)])
+        self.assertEqual(len(notice_ranges), 1)
+
+    @mock.patch("telegram_bot.tasks.chord")
+    def test_coordinator_without_chunks_reports_the_same_shape(self, chord):
+        Borrowing.objects.all().delete()
+        UserProfile.objects.all().delete()
+
+        self.assertEqual(every_day_notification(), {"chunks": 0, "chord_id": None})
+        chord.assert_not_called()
+
+    def test_summary_adds_up_chunk_counts(self):
+        summary = summarize_notifications([
+            {"sent": 2, "skipped": 1, "failed": 0},
+            {"sent": 3, "skipped": 0, "failed": 1},
+        ])
+
+        self.assertEqual(summary, {"chunks": 2, "sent": 5, "skipped": 1, "failed": 1})
+
+
+class TelegramSenderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.now = [1000.0]
+        self.sleep = mock.Mock(side_effect=self.advance)
+        self.sender = self.make_sender()
+
+    def advance(self, seconds):
+        self.now[0] += seconds
+
+    def make_sender(self, **kwargs):
+        return TelegramSender(
+            token="token", api_base="http://telegram.test", clock=lambda: self.now[0], sleep=self.sleep, **kwargs
+        )
+
+    @staticmethod
+    def response(status_code, payload):
+        response = mock.Mock(status_code=status_code)
+        response.json.return_value = payload
+        response.raise_for_status.side_effect = (
+            requests.HTTPError(response=response) if status_code >= 400 else None
+        )
+        return response
+
+    def test_send_waits_retry_after_on_429_and_retries(self):
+        responses = iter([
+            self.response(429, {"ok": False, "parameters": {"retry_after": 7}}),
+            self.response(200, {"ok": True}),
+        ])
+        posted_at = []
+        self.sender.session.post = mock.Mock(
+            side_effect=lambda *args, **kwargs: posted_at.append(self.now[0]) or next(responses)
+        )
+
+        result = self.sender.send(111, "Hello")
+
+        self.assertEqual(result, {"ok": True})
+        self.assertEqual(self.sender.session.post.call_count, 2)
+        self.assertAlmostEqual(posted_at[1] - posted_at[0], 7)
+
+    def test_send_many_counts_failed_messages(self):
+        self.sender.session.post = mock.Mock(side_effect=lambda url, data, timeout: (
+            self.response(403, {"ok": False}) if data["chat_id"] == 2 else self.response(200, {"ok": True})
+        ))
+
+        result = self.sender.send_many([(1, "a"), (2, "b"), (3, "c")])
+
+        self.assertEqual(result, {"sent": 2, "failed": 1})
+
+    def test_global_limit_is_shared_by_every_sender(self):
+        first = SharedRateLimiter(30, "telegram:rate", clock=lambda: self.now[0], sleep=self.sleep)
+        second = SharedRateLimiter(30, "telegram:rate", clock=lambda: self.now[0], sleep=self.sleep)
+
+        for _ in range(3):
+            first.acquire()
+            second.acquire()
+        self.sleep.assert_not_called()
+
+        first.acquire()
+        self.sleep.assert_called_once()
+        self.assertAlmostEqual(self.now[0], 1000.2)
+
+    def test_429_pauses_every_sender(self):
+        self.sender.session.post = mock.Mock(side_effect=[
+            self.response(429, {"ok": False, "parameters": {"retry_after": 7}}),
+            self.response(200, {"ok": True}),
+        ])
+        self.sender.send(111, "Hello")
+        other = self.make_sender()
+        other.session.post = mock.Mock(return_value=self.response(200, {"ok": True}))
+        self.now[0] = 1003.0
+
+        other.send(222, "Hello")
+
+        self.sleep.assert_called_with(4.0)
+
+    def test_chat_buckets_keep_only_the_most_recent_chats(self):
+        sender = self.make_sender(chat_bucket_limit=2)
+
+        for chat_id in (1, 2, 1, 3):
+            sender._chat_bucket(chat_id)
+
+        self.assertEqual(list(sender.chat_buckets), [1, 3])
+
+    def test_token_bucket_waits_when_empty(self):
+        now = [0.0]
+        sleep = mock.Mock(side_effect=lambda seconds: now.__setitem__(0, now[0] + seconds))
+        bucket = TokenBucket(rate=2, capacity=1, clock=lambda: now[0], sleep=sleep)
+
+        bucket.acquire()
+        bucket.acquire()
+
+        sleep.assert_called_once_with(0.5)
+
+
+class NotificationOutboxTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        UserProfile.objects.create(email=self.user.email, telegram_chat_id="111")
+        UserProfile.objects.create(email=self.superuser.email, telegram_chat_id="222")
+
+    @mock.patch("telegram_bot.tasks.deliver_notifications.delay")
+    def test_borrowing_create_queues_notification_and_dispatches_after_commit(self, delay):
+        borrowing_data = {
+            "expected_return_date": timezone.make_aware(datetime(2100, 10, 11, 10, 10, 10)),
+            "book": self.book.id
+        }
+        with mock.patch("payments.tasks.open_checkout_session_task.delay"), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("borrowings:borrowing-list"), data=borrowing_data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        notification = Notification.objects.get()
+        self.assertEqual(notification.email, self.user.email)
+        self.assertIn(self.book.title, notification.text)
+        delay.assert_called_once()
+
+    @mock.patch("telegram_bot.tasks.deliver_notifications.delay")
+    def test_rolled_back_transaction_sends_nothing(self, delay):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    queue_notification(email=self.user.email, text="Hello")
+                    raise ValueError
+            except ValueError:
+                pass
+
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Notification.objects.exists())
+        delay.assert_not_called()
+
+    def test_consumer_marks_sent_skipped_and_retries_failed(self):
+        sender = FakeSender(undeliverable=("222",))
+        Notification.objects.create(email=self.user.email, text="a")
+        Notification.objects.create(email=self.superuser.email, text="b")
+        Notification.objects.create(email="nobody@test.com", text="c")
+
+        with mock.patch("telegram_bot.tasks.get_sender", return_value=sender):
+            result = deliver_notifications()
+
+        statuses = dict(Notification.objects.values_list("text", "status"))
+        self.assertEqual(result, {"sent": 1, "skipped": 1, "failed": 1})
+        self.assertEqual(sender.messages, [("111", "a"), ("222", "b")])
+        self.assertEqual(statuses, {
+            "a": Notification.StatusChoices.SENT,
+            "b": Notification.StatusChoices.PENDING,
+            "c": Notification.StatusChoices.SKIPPED,
+        })
+        self.assertEqual(Notification.objects.get(text="b").attempts, 1)
+
+
+    def test_consumer_sends_with_the_batch_leased_and_releases_it(self):
+        Notification.objects.create(email=self.user.email, text="a")
+        sender = FakeSender()
+        leases_during_send = []
+        send_each = sender.send_each
+        sender.send_each = lambda messages: (
+            leases_during_send.extend(Notification.objects.values_list("leased_until", flat=True))
+            or send_each(messages)
+        )
+
+        with mock.patch("telegram_bot.tasks.get_sender", return_value=sender):
+            deliver_notifications()
+
+        self.assertTrue(all(leases_during_send))
+        self.assertIsNone(Notification.objects.get().leased_until)
+        self.assertEqual(claim_notifications(0, timezone.now()), [])
+
+    def test_consumer_skips_leased_rows_until_the_lease_expires(self):
+        notification = Notification.objects.create(
+            email=self.user.email, text="a", leased_until=timezone.now() + timedelta(minutes=1)
+        )
+
+        self.assertEqual(claim_notifications(0, timezone.now()), [])
+        self.assertEqual(claim_notifications(0, timezone.now() + timedelta(minutes=2)), [notification])
+
+    @mock.patch("telegram_bot.tasks.deliver_notifications.delay", side_effect=ConnectionError("broker down"))
+    def test_broker_failure_does_not_fail_the_committed_request(self, delay):
+        delay.__qualname__ = "deliver_notifications.delay"
+        with self.assertLogs("django.test", level="ERROR"), self.captureOnCommitCallbacks(execute=True):
+            queue_notification(email=self.user.email, text="Hello")
+
+        delay.assert_called_once()
+        self.assertTrue(Notification.objects.filter(status=Notification.StatusChoices.PENDING).exists())
+
+
+class InventoryConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 10
+
+    def setUp(self):
+        self.book = Book.objects.create(
+            title="Kobzar",
+            author="Taras Schevchenko",
+            cover="HARD",
+            inventory=25,
+            daily_fee=1.00
+        )
+
+    def reserve_until_answered(self):
+        while True:
+            try:
+                with transaction.atomic():
+                    return Book.objects.reserve(self.book.pk)
+            except OperationalError:
+                continue
+
+    def hammer(self, barrier):
+        try:
+            barrier.wait()
+            return [self.reserve_until_answered() for _ in range(self.ATTEMPTS_PER_THREAD)]
+        finally:
+            connection.close()
+
+    def test_inventory_never_goes_negative_or_drifts_under_concurrent_reservations(self):
+        barrier = threading.Barrier(self.THREADS)
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            results = [
+                reserved
+                for thread_results in executor.map(self.hammer, [barrier] * self.THREADS)
+                for reserved in thread_results
+            ]
+
+        self.book.refresh_from_db()
+        self.assertEqual(results.count(True), 25)
+        self.assertEqual(self.book.inventory, 0)
+
+    def test_release_returns_copy_to_the_shelf(self):
+        Book.objects.reserve(self.book.pk)
+        Book.objects.release(self.book.pk)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.inventory, 25)
+
+
+@mock.patch("telegram_bot.tasks.deliver_notifications.delay")
+@mock.patch("payments.tasks.open_checkout_session_task.delay")
+class BulkBorrowingApiTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.bulk_url = reverse("borrowings:borrowing-bulk")
+        self.data = {
+            "book_ids": [self.book.id, self.book1.id],
+            "expected_return_date": timezone.make_aware(datetime(2100, 10, 11, 10, 10, 10)),
+        }
+
+    def test_bulk_borrowing_reserves_all_books_and_opens_one_checkout(self, open_session, _):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.bulk_url, data=self.data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([borrowing["book"] for borrowing in response.data["borrowings"]], self.data["book_ids"])
+        self.assertEqual(
+            list(Payment.objects.filter(id__in=response.data["payment_ids"]).values_list("borrowing_id", flat=True)),
+            [borrowing["id"] for borrowing in response.data["borrowings"]]
+        )
+        self.assertEqual(list(Book.objects.order_by("id").values_list("inventory", flat=True)), [2, 2])
+        open_session.assert_called_once_with(response.data["payment_ids"])
+
+    def test_bulk_borrowing_rolls_back_when_any_book_is_out_of_stock(self, *_):
+        Book.objects.filter(pk=self.book1.pk).update(inventory=0)
+        borrowings_count = Borrowing.objects.count()
+
+        response = self.client.post(self.bulk_url, data=self.data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Borrowing.objects.count(), borrowings_count)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).inventory, 3)
+
+    def test_bulk_borrowing_rejects_duplicate_books(self, *_):
+        self.data["book_ids"] = [self.book.id, self.book.id]
+
+        response = self.client.post(self.bulk_url, data=self.data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @mock.patch("payments.views.stripe.checkout.Session.create")
+    def test_checkout_task_opens_one_session_with_a_line_item_per_book(self, session_create, *_):
+        session_create.return_value = mock.Mock(id="cs_test_cart", url="https://checkout.test/cs_test_cart")
+        response = self.client.post(self.bulk_url, data=self.data, format="json")
+
+        open_checkout_session_task(response.data["payment_ids"])
+
+        self.assertEqual(len(session_create.call_args.kwargs["line_items"]), 2)
+        self.assertEqual(
+            set(Payment.objects.filter(id__in=response.data["payment_ids"]).values_list("session_id", flat=True)),
+            {"cs_test_cart"}
+        )
+
+    @mock.patch("payments.views.stripe.checkout.Session.retrieve")
+    def test_success_callback_marks_every_payment_of_the_session_paid(self, session_retrieve, *_):
+        session_retrieve.return_value = mock.Mock(
+            id="cs_test_cart", payment_status="paid", amount_total=200, currency="usd"
+        )
+        response = self.client.post(self.bulk_url, data=self.data, format="json")
+        Payment.objects.filter(id__in=response.data["payment_ids"]).update(session_id="cs_test_cart")
+
+        self.client.get(reverse("payments:success-pay"), {"session_id": "cs_test_cart"})
+
+        self.assertEqual(
+            set(Payment.objects.filter(session_id="cs_test_cart").values_list("status", flat=True)),
+            {"PAID"}
+        )
+        self.assertEqual(
+            set(Borrowing.objects.filter(
+                id__in=[borrowing["id"] for borrowing in response.data["borrowings"]]
+            ).values_list("pay_status", flat=True)),
+            {"PAID"}
+        )
+
+
+class QueryBudgetTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(30):
+            Borrowing.objects.create(
+                expected_return_date=timezone.make_aware(datetime(2100, 10, 11, 10, 10, 10)),
+                book=self.book if i % 2 else self.book1,
+                user=self.user if i % 3 else self.superuser
+            )
+        self.borrowing_url = reverse("borrowings:borrowing-list")
+
+    def test_borrowing_list_for_user_runs_fixed_number_of_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.borrowing_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_borrowing_list_for_staff_runs_fixed_number_of_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.super_access)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.borrowing_url, {"is_active": "true"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_borrowing_detail_loads_book_in_the_same_query(self):
+        borrowing = Borrowing.objects.filter(user=self.user).first()
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("borrowings:borrowing-detail", kwargs={"pk": borrowing.pk}))
+
+        self.assertEqual(response.data["book"]["title"], borrowing.book.title)
+
+    def test_payment_list_runs_fixed_number_of_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("payments:payment_list"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class PaginationTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            Book.objects.create(title=f"Book {i}", author="Author", cover="HARD", inventory=1, daily_fee=1.00)
+        self.list_url = reverse("books:book-list")
+
+    def test_book_list_walks_the_catalog_with_cursor_pages(self):
+        ids = []
+        url = self.list_url + "?page_size=3"
+        while url:
+            response = self.client.get(url)
+            ids += [book["id"] for book in response.data["results"]]
+            url = response.data["next"]
+
+        self.assertEqual(ids, list(Book.objects.order_by("id").values_list("id", flat=True)))
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(IdCursorPagination, "max_page_size", 2):
+            response = self.client.get(self.list_url, {"page_size": 1000})
+
+        self.assertEqual(len(response.data["results"]), 2)
+
+
+class HotLookupIndexTests(BaseCase):
+    """
+    The plans are read from EXPLAIN on the test database. PostgreSQL would
+    rather scan tables this small, so there sequential scans are switched
+    off for the test's transaction to show that the index can be used.
+    """
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        self.assertIn(index_name, queryset.explain())
+
+    def test_overdue_sweep_uses_partial_index_on_open_loans(self):
+        self.assertUsesIndex(overdue_borrowings(timezone.now()), "borrowing_open_due_idx")
+
+    def test_payment_callback_lookup_uses_session_index(self):
+        self.assertUsesIndex(Payment.objects.filter(session_id="cs_test"), "payment_session_id_idx")
+
+    def test_user_payment_list_uses_borrowing_index(self):
+        borrowing_ids = Borrowing.objects.filter(user=self.user.id).values_list("id", flat=True)
+        self.assertUsesIndex(Payment.objects.filter(borrowing_id__in=borrowing_ids), "payment_borrowing_id_idx")
+
+    def test_user_borrowing_lookup_uses_composite_index_only(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Borrowing._meta.db_table)
+        user_indexes = [
+            name for name, constraint in constraints.items()
+            if constraint["index"] and constraint["columns"][0] == "user_id"
+        ]
+
+        self.assertEqual(user_indexes, ["borrowing_user_id_idx"])
+        self.assertUsesIndex(Borrowing.objects.filter(user=self.user), "borrowing_user_id_idx")
+
+    def test_webhook_chat_lookup_uses_chat_id_index(self):
+        self.assertUsesIndex(UserProfile.objects.filter(telegram_chat_id="111"), "userprofile_chat_id_idx")
+
+    def test_rollup_scans_use_date_indexes(self):
+        start = timezone.now()
+        self.assertUsesIndex(Borrowing.objects.filter(borrow_date__gte=start), "borrowing_borrow_date_idx")
+        self.assertUsesIndex(Borrowing.objects.filter(actual_return_date__gte=start), "borrowing_returned_idx")
+        self.assertUsesIndex(Payment.objects.filter(paid_at__gte=start), "payment_paid_at_idx")
+
+    def test_outbox_drain_uses_pending_index(self):
+        pending = Notification.objects.filter(status=Notification.StatusChoices.PENDING, id__gt=0).order_by("id")
+        self.assertUsesIndex(pending[:200], "notification_pending_idx")
+
+
+class CatalogCacheTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.client.logout()
+        self.list_url = reverse("books:book-list")
+        self.detail_url = reverse("books:book-detail", kwargs={"pk": self.book.pk})
+
+    def test_repeated_list_and_detail_are_served_without_queries(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+
+        with self.assertNumQueries(0):
+            list_response = self.client.get(self.list_url)
+            detail_response = self.client.get(self.detail_url)
+
+        self.assertContains(list_response, self.book.title)
+        self.assertEqual(detail_response.data["title"], self.book.title)
+
+    def test_list_variants_share_one_cache_entry(self):
+        self.client.get(self.list_url, {"page_size": 1, "utm_source": "mail"})
+
+        with mock.patch.object(IdCursorPagination, "max_page_size", 1), self.assertNumQueries(0):
+            response = self.client.get(self.list_url, {"page_size": 1000, "ordering": "-id", "junk": "x"})
+
+        self.assertEqual(len(response.data["results"]), 1)
+        next_query = parse_qs(urlsplit(response.data["next"]).query)
+        self.assertEqual(sorted(next_query), ["cursor", "page_size"])
+        self.assertEqual(next_query["page_size"], ["1"])
+
+    def test_book_update_invalidates_cached_pages(self):
+        self.client.get(self.detail_url)
+
+        Book.objects.filter(pk=self.book.pk).update(title="Stale")
+        self.assertEqual(self.client.get(self.detail_url).data["title"], self.book.title)
+
+        self.book.title = "Haidamaky"
+        self.book.save()
+        self.assertEqual(self.client.get(self.detail_url).data["title"], "Haidamaky")
+
+    def test_inventory_change_invalidates_cached_pages(self):
+        self.client.get(self.detail_url)
+
+        Book.objects.reserve(self.book.pk)
+
+        self.assertEqual(self.client.get(self.detail_url).data["inventory"], 2)
+
+    def test_loans_keep_list_pages_until_a_book_runs_out(self):
+        self.client.get(self.list_url)
+        Book.objects.reserve(self.book.pk)
+
+        with self.assertNumQueries(0):
+            self.client.get(self.list_url)
+
+        Book.objects.filter(pk=self.book.pk).update(inventory=1)
+        Book.objects.reserve(self.book.pk)
+        response = self.client.get(self.list_url)
+        inventory = {book["id"]: book["inventory"] for book in response.data["results"]}
+        self.assertEqual(inventory[self.book.pk], 0)
+
+        Book.objects.release(self.book.pk)
+        response = self.client.get(self.list_url)
+        inventory = {book["id"]: book["inventory"] for book in response.data["results"]}
+        self.assertEqual(inventory[self.book.pk], 1)
+
+    def test_missing_book_is_not_cached(self):
+        missing_url = reverse("books:book-detail", kwargs={"pk": 999})
+
+        self.assertEqual(self.client.get(missing_url).status_code, status.HTTP_404_NOT_FOUND)
+        Book.objects.create(id=999, title="Late", author="Author", cover="HARD", inventory=1, daily_fee=1.00)
+        self.assertEqual(self.client.get(missing_url).status_code, status.HTTP_200_OK)
+
+    def test_cache_stats_are_admin_only_and_count_hits(self):
+        self.client.get(self.detail_url)
+        self.client.get(self.detail_url)
+        stats_url = reverse("books:book-cache-stats")
+
+        self.assertEqual(self.client.get(stats_url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.super_access)
+        response = self.client.get(stats_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(response.data["hits"], 0)
+        self.assertGreater(response.data["hit_ratio"], 0)
+
+
+class ConditionalGetTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.book_url = reverse("books:book-detail", kwargs={"pk": self.book.pk})
+        self.borrowing_list_url = reverse("borrowings:borrowing-list")
+        self.borrowing_url = reverse("borrowings:borrowing-detail", kwargs={"pk": self.borrowing.pk})
+
+    def test_unchanged_book_is_answered_with_304_without_queries(self):
+        self.client.logout()
+        etag = self.client.get(self.book_url)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.book_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_book_etag_changes_after_reservation(self):
+        etag = self.client.get(self.book_url)["ETag"]
+
+        Book.objects.reserve(self.book.pk)
+        response = self.client.get(self.book_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["inventory"], 2)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_unchanged_borrowing_list_is_answered_with_304(self):
+        first = self.client.get(self.borrowing_list_url)
+        self.assertIn("Last-Modified", first)
+
+        # Only the user is loaded: the borrowings are not touched at all.
+        with self.assertNumQueries(1):
+            response = self.client.get(self.borrowing_list_url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_borrowing_list_etag_changes_after_update_and_new_borrowing(self):
+        etag = self.client.get(self.borrowing_list_url)["ETag"]
+
+        self.borrowing.pay_status = "PENDING"
+        self.borrowing.save()
+        updated_etag = self.client.get(self.borrowing_list_url, HTTP_IF_NONE_MATCH=etag)["ETag"]
+        self.assertNotEqual(updated_etag, etag)
+
+        Borrowing.objects.create(
+            expected_return_date=timezone.make_aware(datetime(2100, 10, 11, 10, 10, 10)),
+            book=self.book,
+            user=self.user
+        )
+        response = self.client.get(self.borrowing_list_url, HTTP_IF_NONE_MATCH=updated_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_borrowing_list_etag_follows_returns_and_other_users(self):
+        etag = self.client.get(self.borrowing_list_url)["ETag"]
+        other = get_user_model().objects.create_user(email="other@test.com", password="1qazcde3")
+        Borrowing.objects.create(
+            expected_return_date=timezone.make_aware(datetime(2100, 10, 11, 10, 10, 10)), book=self.book, user=other
+        )
+        response = self.client.get(self.borrowing_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.super_access)
+        self.client.post(reverse("borrowings:return-book", kwargs={"pk": self.borrowing.pk}))
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        response = self.client.get(self.borrowing_list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_borrowing_list_etag_is_per_user(self):
+        etag = self.client.get(self.borrowing_list_url)["ETag"]
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.super_access)
+
+        response = self.client.get(self.borrowing_list_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_borrowing_detail_etag_follows_its_book(self):
+        etag = self.client.get(self.borrowing_url)["ETag"]
+        self.assertEqual(
+            self.client.get(self.borrowing_url, HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+        Book.objects.reserve(self.book.pk)
+        response = self.client.get(self.borrowing_url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["book"]["inventory"], 2)
+
+
+class BookSearchTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.client.logout()
+        self.search_url = reverse("books:book-search")
+        self.author_match = Book.objects.create(
+            title="Poems", author="Kobzarenko", cover="SOFT", inventory=1, daily_fee=1.00
+        )
+
+    def search(self, **params):
+        return self.client.get(self.search_url, params)
+
+    def titles(self, response):
+        return [book["title"] for book in response.data["results"]]
+
+    def test_words_match_as_prefixes_of_title_and_author(self):
+        self.assertEqual(self.titles(self.search(q="kobz schev")), ["Kobzar"])
+        self.assertEqual(self.titles(self.search(q="LESYA")), ["Kolobok"])
+
+    def test_title_matches_rank_above_author_matches(self):
+        self.assertEqual(self.titles(self.search(q="kobz")), ["Kobzar", "Poems"])
+
+    def test_index_follows_bulk_updates_and_deletes(self):
+        Book.objects.filter(pk=self.book.pk).update(title="Haidamaky")
+        Book.objects.filter(pk=self.book1.pk).delete()
+
+        self.assertEqual(self.titles(self.search(q="haidam")), ["Haidamaky"])
+        self.assertEqual(self.titles(self.search(q="kolobok")), [])
+
+    def test_results_are_paginated_without_counting(self):
+        first_page = self.search(q="kobz", limit=1)
+
+        self.assertEqual(self.titles(first_page), ["Kobzar"])
+        self.assertNotIn("count", first_page.data)
+        second_page = self.client.get(first_page.data["next"])
+        self.assertEqual(self.titles(second_page), ["Poems"])
+        self.assertIsNone(second_page.data["next"])
+
+    def test_query_without_words_is_rejected(self):
+        self.assertEqual(self.search(q=" \"*- ").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.search().status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_reads_the_full_text_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.search(q="kobz")
+
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN {queries[-1]['sql']}")
+                self.assertIn("book_search_idx", str(cursor.fetchall()))
+            else:
+                cursor.execute(f"EXPLAIN QUERY PLAN {queries[-1]['sql']}")
+                self.assertIn("VIRTUAL TABLE INDEX", str(cursor.fetchall()))
+
+
+class ImportBooksCommandTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_feed(self, name, content):
+        path = Path(self.directory.name) / name
+        path.write_text(content, encoding="utf-8")
+        return path
+
+    def import_books(self, path, **options):
+        output = StringIO()
+        call_command("import_books", str(path), stdout=output, **options)
+        return output.getvalue()
+
+    def test_csv_rows_are_inserted_and_existing_editions_updated(self):
+        existing = Book.objects.create(
+            title="Haidamaky", author="Taras Schevchenko", cover="Hard", inventory=1, daily_fee=1.00
+        )
+        path = self.write_feed(
+            "feed.csv",
+            "title,author,cover,inventory,daily_fee\n"
+            "Haidamaky,Taras Schevchenko,Hard,10,2.50\n"
+            "Zapovit,Taras Schevchenko,Soft,2,0.90\n"
+            "Kateryna,Taras Schevchenko,Soft,4,1.20\n"
+        )
+
+        output = self.import_books(path, chunk_size=2)
+
+        self.assertIn("Imported 3 books", output)
+        self.assertIn("rows/s", output)
+        self.assertEqual(Book.objects.count(), 5)
+        existing.refresh_from_db()
+        self.assertEqual((existing.inventory, float(existing.daily_fee)), (10, 2.50))
+        self.assertEqual(Book.objects.get(title="Kateryna").inventory, 4)
+
+    def test_invalid_rows_are_written_to_the_rejects_file(self):
+        path = self.write_feed(
+            "feed.jsonl",
+            json.dumps({"title": "Zapovit", "author": "Taras", "cover": "Soft", "inventory": 1, "daily_fee": 1}) + "\n"
+            + json.dumps({"title": "Broken", "author": "Taras", "cover": "Soft", "inventory": -1, "daily_fee": 1}) + "\n"
+            + "\n"
+            + "{not json\n"
+        )
+
+        output = self.import_books(path)
+
+        self.assertIn("2 rows rejected", output)
+        self.assertTrue(Book.objects.filter(title="Zapovit").exists())
+        self.assertFalse(Book.objects.filter(title="Broken").exists())
+        rejects = [json.loads(line) for line in Path(f"{path}.rejects.jsonl").read_text().splitlines()]
+        self.assertEqual([reject["line"] for reject in rejects], [2, 4])
+        self.assertIn("inventory", rejects[0]["errors"])
+
+    def test_duplicate_editions_in_one_chunk_keep_the_last_row(self):
+        path = self.write_feed(
+            "feed.csv",
+            "title,author,cover,inventory,daily_fee\n"
+            "Zapovit,Taras,Soft,1,1.00\n"
+            "Zapovit,Taras,Soft,7,1.00\n"
+        )
+
+        self.import_books(path)
+
+        self.assertEqual(Book.objects.get(title="Zapovit").inventory, 7)
+
+    def test_import_invalidates_the_catalog_once(self):
+        path = self.write_feed("feed.csv", "title,author,cover,inventory,daily_fee\nZapovit,Taras,Soft,1,1.00\n")
+
+        with mock.patch("books.management.commands.import_books.invalidate_catalog") as invalidate:
+            self.import_books(path, chunk_size=1)
+
+        invalidate.assert_called_once_with()
+
+
+class AccountingExportTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.super_access)
+
+    def export(self, kind, **params):
+        response = self.client.get(reverse("borrowings:export", kwargs={"kind": kind}), params)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_is_admin_only(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+
+        response = self.client.get(reverse("borrowings:export", kwargs={"kind": "borrowings"}))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_borrowings_are_streamed_as_csv(self):
+        lines = self.export("borrowings").splitlines()
+
+        self.assertTrue(lines[0].startswith("id,borrow_date,expected_return_date"))
+        self.assertEqual(len(lines), 3)
+        self.assertIn("Kobzar", lines[1])
+        self.assertIn(self.user.email, lines[1])
+
+    def test_payments_are_streamed_as_ndjson_within_date_range(self):
+        body = self.export("payments", output="ndjson", date_from="2030-01-01", date_to="2030-12-31")
+
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.payment1.id])
+        self.assertEqual(rows[0]["money_to_pay"], "29.99")
+        self.assertEqual(rows[0]["user_email"], self.superuser.email)
+
+    def test_date_to_is_inclusive(self):
+        body = self.export("borrowings", output="ndjson", date_to="2025-10-10")
+
+        self.assertEqual([json.loads(line)["id"] for line in body.splitlines()], [self.borrowing.id])
+
+    def test_invalid_params_and_unknown_export_are_rejected(self):
+        url = reverse("borrowings:export", kwargs={"kind": "borrowings"})
+
+        self.assertEqual(self.client.get(url, {"date_from": "yesterday"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(url, {"date_from": "2030-01-02", "date_to": "2030-01-01"}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.get(reverse("borrowings:export", kwargs={"kind": "users"})).status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+
+    def test_command_writes_the_same_export(self):
+        output = StringIO()
+
+        call_command("export_accounting", "payments", "--from", "2025-01-01", "--to", "2025-12-31", stdout=output)
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "id,status,type,money_to_pay,session_id,borrowing_id,borrow_date,user_email")
+        self.assertEqual(len(lines), 2)
+
+
+class BulkInventoryTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.super_access)
+        self.url = reverse("books:book-inventory")
+
+    def adjust(self, *adjustments):
+        return self.client.post(self.url, {"adjustments": list(adjustments)}, format="json")
+
+    def test_deltas_and_absolute_values_are_applied_with_per_item_results(self):
+        response = self.adjust(
+            {"book_id": self.book.id, "delta": 2},
+            {"book_id": self.book1.id, "inventory": 10},
+            {"book_id": 999, "delta": 1},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["updated"], 2)
+        self.assertEqual(
+            [result["status"] for result in response.data["results"]],
+            ["updated", "updated", "not_found"]
+        )
+        self.assertEqual(Book.objects.get(pk=self.book.id).inventory, 5)
+        self.assertEqual(Book.objects.get(pk=self.book1.id).inventory, 10)
+
+    def test_adjustment_below_zero_is_rejected_alone(self):
+        response = self.adjust(
+            {"book_id": self.book.id, "delta": -4},
+            {"book_id": self.book1.id, "delta": -3},
+        )
+
+        self.assertEqual(response.data["results"][0]["status"], "rejected")
+        self.assertEqual(response.data["results"][1], {"book_id": self.book1.id, "status": "updated", "inventory": 0})
+        self.assertEqual(Book.objects.get(pk=self.book.id).inventory, 3)
+
+    def test_batch_runs_a_fixed_number_of_queries(self):
+        books = [
+            Book.objects.create(title=f"Book {i}", author="Author", cover="Hard", inventory=1, daily_fee=1.00)
+            for i in range(50)
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.adjust(*({"book_id": book.id, "delta": 1} for book in books))
+
+        updates = [query for query in queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertIn("CASE", updates[0]["sql"])
+
+    def test_catalog_cache_is_invalidated_once_per_batch(self):
+        with mock.patch("books.models.invalidate_catalog") as invalidate:
+            self.adjust({"book_id": self.book.id, "delta": 1}, {"book_id": self.book1.id, "delta": 1})
+
+        invalidate.assert_called_once_with()
+
+    def test_database_refuses_negative_inventory(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Book.objects.filter(pk=self.book.id).update(inventory=-1)
+
+    def test_invalid_items_and_non_admins_are_rejected(self):
+        self.assertEqual(
+            self.adjust({"book_id": self.book.id, "delta": 1, "inventory": 1}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        self.assertEqual(self.adjust({"book_id": self.book.id, "delta": 1}).status_code, status.HTTP_403_FORBIDDEN)
+
+
+@mock.patch("telegram_bot.tasks.deliver_notifications.delay")
+@mock.patch("payments.tasks.open_checkout_session_task.delay")
+class BookCountersTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        reconcile_counters()
+
+    def counters(self, book):
+        book.refresh_from_db()
+        return book.on_loan, book.overdue, book.lifetime_loans
+
+    def test_reconcile_counts_the_fixture_loans(self, *_):
+        self.assertEqual(self.counters(self.book), (1, 1, 1))
+        self.assertEqual(self.counters(self.book1), (1, 0, 1))
+        self.assertEqual(float(self.book.revenue), 19.99)
+
+    def test_borrowing_create_counts_a_new_loan(self, *_):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("borrowings:borrowing-list"), {
+                "book": self.book.id,
+                "expected_return_date": timezone.make_aware(datetime(2100, 10, 11, 10, 10, 10))
+            }, format="json")
+
+        self.assertEqual(self.counters(self.book), (2, 1, 2))
+        self.assertEqual(self.book.inventory, 2)
+
+    def test_returning_an_overdue_loan_updates_both_counters(self, *_):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.super_access)
+
+        response = self.client.post(reverse("borrowings:return-book", kwargs={"pk": self.borrowing.pk}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.counters(self.book), (0, 0, 1))
+
+    def test_cancelled_loan_is_taken_off_the_lifetime_count(self, *_):
+        Payment.objects.create(type="PAYMENT", borrowing_id=self.borrowing.id, session_id="cs_cancel", money_to_pay=1)
+
+        self.client.get(reverse("payments:cancel-pay"), {"session_id": "cs_cancel"})
+
+        on_loan, _, lifetime_loans = self.counters(self.book)
+        self.assertEqual((on_loan, lifetime_loans), (0, 0))
+
+    def test_cancel_keeps_every_counter_in_step(self, *_):
+        returned = Borrowing.objects.create(
+            expected_return_date=timezone.make_aware(datetime(2025, 10, 11, 10, 10, 10)),
+            actual_return_date=timezone.make_aware(datetime(2025, 10, 12, 10, 10, 10)),
+            book=self.book1,
+            user=self.user
+        )
+        Payment.objects.create(status="PAID", type="PAYMENT", borrowing=returned, money_to_pay=3)
+        reconcile_counters()
+        self.book1.refresh_from_db()
+        book1_revenue = self.book1.revenue
+        for borrowing in (self.borrowing, returned):
+            Payment.objects.create(type="FINE", borrowing=borrowing, session_id="cs_cancel", money_to_pay=1)
+
+        response = self.client.get(reverse("payments:cancel-pay"), {"session_id": "cs_cancel"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(reconcile_counters(fix=False)["drifted"], 0)
+        self.assertEqual(self.counters(self.book), (0, 0, 0))
+        self.assertEqual(float(self.book.revenue), 0)
+        self.assertEqual(self.counters(self.book1), (1, 0, 1))
+        self.assertEqual(self.book1.revenue, book1_revenue - 3)
+
+    def test_successful_payment_adds_revenue_once(self, *_):
+        Payment.objects.create(
+            status="PENDING", type="FINE", borrowing_id=self.borrowing.id, session_id="cs_paid", money_to_pay=5
+        )
+        session = mock.Mock(id="cs_paid", payment_status="paid", amount_total=500, currency="usd")
+
+        with mock.patch("stripe.checkout.Session.retrieve", return_value=session):
+            self.client.get(reverse("payments:success-pay"), {"session_id": "cs_paid"})
+            self.client.get(reverse("payments:success-pay"), {"session_id": "cs_paid"})
+
+        self.book.refresh_from_db()
+        self.assertEqual(float(self.book.revenue), 24.99)
+
+    def test_overdue_counters_follow_the_clock(self, *_):
+        Book.objects.filter(pk=self.book.pk).update(overdue=0)
+        Borrowing.objects.filter(pk=self.borrowing1.pk).update(expected_return_date=timezone.now())
+
+        self.assertEqual(refresh_overdue_counters(), 2)
+        self.assertEqual(self.counters(self.book)[1], 1)
+        self.assertEqual(self.counters(self.book1)[1], 1)
+
+    def test_reconcile_reports_and_fixes_drift(self, *_):
+        Book.objects.filter(pk=self.book.pk).update(on_loan=7, lifetime_loans=0)
+        output = StringIO()
+
+        call_command("reconcile_book_counters", "--dry-run", stdout=output)
+        self.assertIn("1 drifted", output.getvalue())
+        self.assertEqual(self.counters(self.book)[0], 7)
+
+        report = reconcile_counters()
+        self.assertEqual((report["drifted"], report["on_loan"], report["lifetime_loans"]), (1, 1, 1))
+        self.assertEqual(self.counters(self.book), (1, 1, 1))
+
+    def test_catalog_shows_counters(self, *_):
+        response = self.client.get(reverse("books:book-detail", kwargs={"pk": self.book.pk}))
+
+        self.assertEqual(response.data["on_loan"], 1)
+        self.assertEqual(response.data["overdue"], 1)
+        self.assertNotIn("revenue", response.data)
+
+
+class AnalyticsTests(BaseCase):
+    def setUp(self):
+        super().setUp()
+        self.day = date(2025, 10, 10)
+        noon = timezone.make_aware(datetime(2025, 10, 10, 12, 0))
+        Payment.objects.filter(pk=self.payment.pk).update(paid_at=noon)
+        Payment.objects.create(status="PAID", type="FINE", borrowing_id=self.borrowing.id, money_to_pay=5, paid_at=noon)
+        Payment.objects.create(status="PENDING", type="PAYMENT", borrowing_id=self.borrowing.id, money_to_pay=7, paid_at=noon)
+        Borrowing.objects.filter(pk=self.borrowing1.pk).update(actual_return_date=noon)
+        build_rollups(self.day, self.day)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.super_access)
+        self.url = reverse("analytics:analytics")
+
+    def get(self, **params):
+        return self.client.get(self.url, {"date_from": "2025-10-01", "date_to": "2025-10-31", **params})
+
+    def test_day_is_rolled_up_per_book_cohort_and_in_total(self):
+        totals = DailyTotals.objects.get(date=self.day)
+
+        self.assertEqual((totals.loans, totals.returns), (1, 1))
+        self.assertEqual((float(totals.revenue), float(totals.fines)), (24.99, 5.00))
+        book_stats = DailyBookStats.objects.get(date=self.day, book=self.book)
+        self.assertEqual((book_stats.loans, float(book_stats.revenue)), (1, 24.99))
+        self.assertEqual(DailyBookStats.objects.get(date=self.day, book=self.book1).returns, 1)
+        cohort = DailyCohortStats.objects.get(date=self.day)
+        self.assertEqual(cohort.cohort, timezone.localdate(self.user.date_joined).replace(day=1))
+
+    def test_rebuilding_a_day_replaces_its_rollups(self):
+        build_rollups(self.day, self.day)
+
+        self.assertEqual(DailyTotals.objects.filter(date=self.day).count(), 1)
+        self.assertEqual(DailyBookStats.objects.filter(date=self.day).count(), 2)
+
+    def test_nightly_run_continues_after_the_last_rolled_up_day(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        DailyTotals.objects.create(date=yesterday - timedelta(days=2))
+
+        days = build_rollups()
+
+        self.assertEqual(days, [yesterday - timedelta(days=1), yesterday])
+
+    def test_range_is_answered_from_rollups_only(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(top=1)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any("borrowings_borrowing" in query["sql"] for query in queries))
+        self.assertFalse(any("payments_payment" in query["sql"] for query in queries))
+        self.assertEqual(response.data["totals"]["loans"], 1)
+        self.assertEqual(len(response.data["daily"]), 1)
+        self.assertEqual(response.data["top_titles"], [
+            {"book_id": self.book.id, "title": "Kobzar", "loans": 1, "revenue": Decimal("24.99")}
+        ])
+        self.assertEqual(response.data["cohorts"][0]["loans"], 1)
+
+    def test_analytics_are_admin_only_and_validate_the_range(self):
+        self.assertEqual(self.get(date_from="2025-11-01").status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.access_token)
+        self.assertEqual(self.get().status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_successful_payment_records_when_it_was_paid(self):
+        Payment.objects.create(status="PENDING", type="PAYMENT", borrowing_id=self.borrowing.id, session_id="cs_new", money_to_pay=3)
+        session = mock.Mock(id="cs_new", payment_status="paid", amount_total=300, currency="usd")
+
+        with mock.patch("stripe.checkout.Session.retrieve", return_value=session), \
+                mock.patch("telegram_bot.tasks.deliver_notifications.delay"):
+            self.client.get(reverse("payments:success-pay"), {"session_id": "cs_new"})
+
+        self.assertIsNotNone(Payment.objects.get(session_id="cs_new").paid_at)
+
+
+class InstrumentationTests(BaseCase):
+    def test_response_reports_queries_and_total_in_server_timing(self):
+        labels = {"view": "borrowings:borrowing-list", "method": "GET", "status": "2xx"}
+        before = sample_value("library_http_requests_total", labels)
+
+        response = self.client.get(reverse("borrowings:borrowing-list"))
+
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", total;dur=[\d.]+$')
+        self.assertEqual(sample_value("library_http_requests_total", labels), before + 1)
+
+    def test_external_calls_are_timed_per_service(self):
+        session = mock.Mock(
+            id="fake_id_777777779999999900000", payment_status="unpaid", amount_total=1999, currency="usd"
+        )
+        before = sample_value("library_external_calls_total", {"service": "stripe"})
+
+        with mock.patch("stripe.checkout.Session.retrieve", return_value=session):
+            response = self.client.get(reverse("payments:success-pay"), {"session_id": session.id})
+
+        self.assertIn('stripe;dur=', response["Server-Timing"])
+        self.assertIn('desc="1 calls"', response["Server-Timing"])
+        self.assertEqual(sample_value("library_external_calls_total", {"service": "stripe"}), before + 1)
+
+    def test_fine_checkout_is_timed_as_a_stripe_call(self):
+        before = sample_value("library_external_calls_total", {"service": "stripe"})
+        session = mock.Mock(id="cs_fine", url="https://checkout.test/cs_fine")
+
+        with mock.patch("stripe.checkout.Session.create", return_value=session):
+            create_fine_checkout_session(self.borrowing.id, count_of_delay_days=2)
+
+        self.assertEqual(sample_value("library_external_calls_total", {"service": "stripe"}), before + 1)
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_metrics_endpoint_renders_prometheus_text(self):
+        with track_external("telegram"):
+            pass
+        self.client.credentials()
+
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-secret")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertRegex(
+            body, r'library_external_call_duration_seconds_bucket\{le="\+Inf",service="telegram"\} [1-9]'
+        )
+        self.assertIn("library_catalog_cache_lookups_total", body)
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_metrics_endpoint_requires_the_configured_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.credentials()
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-secret")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_metrics_endpoint_is_closed_without_a_token(self):
+        self.client.credentials()
+
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(
+            self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer ").status_code,
+            status.HTTP_403_FORBIDDEN
+        )
+
+    @override_settings(SLOW_REQUEST_MS=500)
+    def test_slow_requests_are_logged_with_their_sql(self):
+        clock = mock.Mock(perf_counter=mock.Mock(side_effect=itertools.count()))
+
+        with mock.patch("library_service.middleware.time", clock), \
+                self.assertLogs("library_service.slow_requests", level="WARNING") as logs:
+            self.client.get(reverse("books:book-list"))
+
+        self.assertIn("Slow request GET /api/library/book/", logs.output[0])
+        self.assertIn("books_book", logs.output[0])
+
+
+@override_settings(REPLICA_DATABASES=["replica_0"])
+@mock.patch("telegram_bot.tasks.deliver_notifications.delay")
+@mock.patch("payments.tasks.open_checkout_session_task.delay")
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    A TransactionTestCase, since reads inside a transaction always stay on
+    the primary. The replica is the test database itself: what is checked
+    is whether a replica was chosen.
+    """
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(email="reader@test.com", password="1qazcde3")
+        self.book = Book.objects.create(title="Kobzar", author="Taras Schevchenko", cover="HARD", inventory=3, daily_fee=1)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        patcher = mock.patch("library_service.db_router.choose_replica", return_value="default")
+        self.choose_replica = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(cache.clear)
+
+    def test_safe_reads_of_opted_in_views_go_to_a_replica(self, *_):
+        for url in (reverse("borrowings:borrowing-list"), reverse("payments:payment_list")):
+            self.choose_replica.reset_mock()
+            self.client.get(url)
+            self.choose_replica.assert_called()
+
+    def test_cached_catalog_pages_are_built_from_the_primary(self, *_):
+        self.client.get(reverse("books:book-list"))
+        self.client.get(reverse("books:book-detail", kwargs={"pk": self.book.id}))
+
+        self.choose_replica.assert_not_called()
+
+    def test_rollups_read_from_the_primary(self, *_):
+        build_daily_rollups()
+
+        self.choose_replica.assert_not_called()
+
+    def test_a_write_pins_the_user_to_the_primary_for_a_while(self, *_):
+        response = self.client.post(
+            reverse("borrowings:borrowing-list"),
+            {"book": self.book.id, "expected_return_date": "2030-01-01T00:00:00Z"},
+            format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.client.get(reverse("borrowings:borrowing-list"))
+        self.choose_replica.assert_not_called()
+
+        cache.delete(pin_key(self.user.pk))
+        self.client.get(reverse("borrowings:borrowing-list"))
+        self.choose_replica.assert_called()
+
+    def test_views_that_did_not_opt_in_read_from_the_primary(self, *_):
+        Payment.objects.create(type="PAYMENT", session_id="cs_replica", money_to_pay=1)
+        session = mock.Mock(id="cs_replica", payment_status="unpaid", amount_total=100, currency="usd")
+
+        with mock.patch("stripe.checkout.Session.retrieve", return_value=session):
+            self.client.get(reverse("payments:success-pay"), {"session_id": "cs_replica"})
+
+        self.choose_replica.assert_not_called()
+
+    def test_transactions_and_migrations_stay_on_the_primary(self, *_):
+        router = ReplicaRouter()
+
+        token = routing_state.set(RoutingState(replica_reads=True, follow_writes=False))
+        try:
+            self.assertEqual(router.db_for_read(Book), "default")
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(Book))
+            self.assertEqual(router.db_for_write(Book), "default")
+            self.assertEqual(router.db_for_read(Book), "default")
+        finally:
+            routing_state.reset(token)
+        self.assertEqual(self.choose_replica.call_count, 2)
+        self.assertFalse(router.allow_migrate("replica_0", "books"))